@@ -13,11 +13,11 @@ from pydub import AudioSegment
 import random
 import websocket
 import time
-from minicpm_client import MiniCPMClient
-import base64
+# base64解码复用minicpm_client在导入时选定的实现（pybase64优先）
+from minicpm_client import MiniCPMClient, AudioScratch, gain_clip_i16, b64decode
 import io
 import numpy as np
-import librosa
+import soundfile as sf
 
 
 # 加载.env文件中的环境变量
@@ -127,73 +127,93 @@ def setup_directories():
     os.makedirs(PROCESSED_DIR, exist_ok=True)
     logger.info(f"已创建目录: {AUDIO_DIR}, {PROCESSED_DIR}")
 
-def base64_to_pcm(base64_audio_data, volume_gain=2.0):
-    """将base64音频WAV数据解码为PCM数据"""
+# 采样宽度 -> (numpy dtype, 归一化到[-1, 1]的缩放系数, 偏移)
+_SW_TO_DTYPE = {
+    1: (np.uint8, 1 / 128.0, -1.0),
+    2: (np.int16, 1 / 32768.0, 0.0),
+    4: (np.int32, 1 / 2147483648.0, 0.0),
+}
+
+# 解码/转换工作区，按线程隔离
+_audio_scratch = AudioScratch()
+
+def _wav_to_float(audio_bytes):
+    """用wave模块解析WAV，返回归一化到[-1, 1]的float32数组、采样率和声道数"""
+    with wave.open(io.BytesIO(audio_bytes), 'rb') as wav_file:
+        sample_rate = wav_file.getframerate()
+        channels = wav_file.getnchannels()
+        sample_width = wav_file.getsampwidth()
+        pcm_data = wav_file.readframes(wav_file.getnframes())
+    
+    # 查表取dtype与归一化参数，统一用float32计算
+    dtype, scale, offset = _SW_TO_DTYPE.get(sample_width, (np.float32, 1.0, 0.0))
+    pcm_float = np.frombuffer(pcm_data, dtype).astype(np.float32)
+    # 就地缩放，不再生成除法/减法临时数组
+    pcm_float *= scale
+    if offset:
+        pcm_float += offset
+    if channels > 1:
+        pcm_float = pcm_float.reshape(-1, channels)
+    return pcm_float, sample_rate, channels
+
+def base64_to_pcm(base64_audio_data, volume_gain=2.0, scratch=None):
+    """将base64音频WAV数据解码为PCM数据
+
+    传入scratch（AudioScratch）时解码与int16输出都复用其工作区，返回的数组在同一线程
+    下一次调用前有效，调用方需立即拷贝或发送。
+    """
     volume_gain = max(0.1, min(volume_gain, 5.0))
     
     try:
-        audio_bytes = base64.b64decode(base64_audio_data)
+        audio_bytes = b64decode(base64_audio_data)
     except Exception as e:
         print(f"Base64解码失败: {e}")
         return None, None, None
     
-    # 使用BytesIO创建文件对象
-    audio_buffer = io.BytesIO(audio_bytes)
-    
     try:
-        with wave.open(audio_buffer, 'rb') as wav_file:
+        # libsndfile在C层解码并直接归一化为float32，省去readframes的bytes拷贝与手工缩放
+        with sf.SoundFile(io.BytesIO(audio_bytes)) as snd_file:
             # 获取音频参数
-            frames = wav_file.getnframes()
-            sample_rate = wav_file.getframerate()
-            channels = wav_file.getnchannels()
-            sample_width = wav_file.getsampwidth()
+            frames = snd_file.frames
+            sample_rate = snd_file.samplerate
+            channels = snd_file.channels
             
-            print(f"音频参数: {frames}帧, {sample_rate}Hz, {channels}声道, {sample_width}字节/样本")
+            print(f"音频参数: {frames}帧, {sample_rate}Hz, {channels}声道, {snd_file.subtype}")
             
-            # 读取PCM数据
-            pcm_data = wav_file.readframes(frames)
-            
-            # 转换为numpy数组
-            if sample_width == 1:
-                dtype = np.uint8
-            elif sample_width == 2:
-                dtype = np.int16
-            elif sample_width == 4:
-                dtype = np.int32
+            # 多声道为 (帧数, 声道数)
+            if scratch is not None:
+                pcm_float = scratch.f32(frames * channels)
+                if channels > 1:
+                    pcm_float = pcm_float.reshape(frames, channels)
+                pcm_float = snd_file.read(out=pcm_float)
             else:
-                dtype = np.float32
-                
-            pcm_array = np.frombuffer(pcm_data, dtype)
-
-            if sample_width == 1:
-                pcm_float = pcm_array.astype(np.float32) / 128.0 - 1.0  # 将 uint8 转换为 -1.0 到 1.0
-            elif sample_width == 2:
-                pcm_float = pcm_array.astype(np.float32) / 32768.0  # 将 int16 转换为 -1.0 到 1.0
-            elif sample_width == 4:
-                pcm_float = pcm_array.astype(np.float64) / 2147483648.0  # 将 int32 转换为 -1.0 到 1.0                
-
-            # 如果是多声道，重塑数组
-            if channels > 1:
-                # pcm_array = np.mean(pcm_array, axis=1)
-                pcm_array = pcm_array.reshape(-1, channels)
-
-            # 如果sample_rate不是16000，则重采样到16000
-            if sample_rate != 16000:
-                pcm_array = librosa.resample(pcm_float, orig_sr=sample_rate, target_sr=16000, res_type='kaiser_best')
-                sample_rate = 16000
-            
-            # 重要：将float转回int16 PCM格式
-            pcm_array = np.clip(pcm_array * 32768.0, -32768, 32767).astype(np.int16)
+                pcm_float = snd_file.read(dtype='float32', always_2d=False)
+    except Exception:
+        # libsndfile无法识别时退回wave模块解析
+        try:
+            pcm_float, sample_rate, channels = _wav_to_float(audio_bytes)
+        except Exception as e:
+            print(f"WAV解析失败: {e}")
+            return None, None, None
+
+    # 如果sample_rate不是16000，则重采样到16000（多声道沿帧轴逐声道重采样）
+    if sample_rate != 16000:
+        # 多相FIR重采样，按需导入scipy，避免启动时加载librosa/numba
+        from scipy.signal import resample_poly
+        pcm_float = resample_poly(pcm_float, 16000, sample_rate)
+        sample_rate = 16000
+    
+    # 重要：将float转回int16 PCM格式，缩放、截断与类型转换一次遍历完成
+    out = scratch.i16(pcm_float.size) if scratch is not None else None
+    pcm_array = gain_clip_i16(pcm_float, 32768.0, out=out)
 
-            return pcm_array, sample_rate, channels
-            
-    except Exception as e:
-        print(f"WAV解析失败: {e}")
+    return pcm_array, sample_rate, channels
 
 def on_audio_done(audio_base64):
     global ws, session_id_bytes
 
-    pcm_data = base64_to_pcm(audio_base64)
+    # 回调线程内复用解码工作区，结果随即tobytes拷贝，不会被下一帧覆盖
+    pcm_data = base64_to_pcm(audio_base64, scratch=_audio_scratch)
     if pcm_data[0] is None or pcm_data[0].size == 0:
         logger.error("无法将音频数据转换为字节格式")
         return
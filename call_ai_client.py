@@ -13,9 +13,8 @@ from pydub import AudioSegment
 import random
 import websocket
 import time
-from minicpm_client import MiniCPMClient
-import librosa
-import base64
+# base64解码复用minicpm_client在导入时选定的实现（pybase64优先）
+from minicpm_client import MiniCPMClient, b64decode
 
 
 # 加载.env文件中的环境变量
@@ -78,7 +77,7 @@ def base64_to_wav(base64_audio_data, volume_gain=2.0):
     volume_gain = max(0.1, min(volume_gain, 5.0))
     
     try:
-        audio_bytes = base64.b64decode(base64_audio_data)
+        audio_bytes = b64decode(base64_audio_data)
     except Exception as e:
         print(f"Base64解码失败: {e}")
         return None, None, None
@@ -1,35 +1,759 @@
 import requests
+import asyncio
 import json
 import base64
+import binascii
 import wave
 import io
 import numpy as np
-from sseclient import SSEClient
-import librosa
 import soundfile as sf
 import time
+import math
+import functools
+import struct
 import threading
 import os
-import tempfile
+import mmap
 import queue  # 添加队列支持
+import collections
+from concurrent.futures import ThreadPoolExecutor
 import uuid
+import logging
+import warnings
+from enum import IntEnum
 
 
+# 日志级别默认沿用宿主应用的配置，逐帧调试信息需通过 set_debug() 显式开启
+log = logging.getLogger(__name__)
+# 热路径只检查这个模块级布尔值，关闭时连日志参数都不计算
+_DEBUG = False
+
+
+def set_debug(enabled):
+    """开启/关闭逐帧调试日志"""
+    global _DEBUG
+    _DEBUG = bool(enabled)
+    # 关闭时恢复为未设置（NOTSET），重新继承上级logger的级别
+    log.setLevel(logging.DEBUG if _DEBUG else logging.NOTSET)
+
+# base64编解码实现在导入时选定一次：优先使用带SIMD运行时分派的pybase64，否则回退标准库
+try:
+    import pybase64
+    _b64decode = pybase64.b64decode
+    _b64encode = pybase64.b64encode
+    _B64_BACKEND = "pybase64"
+except ImportError:
+    # a2b_base64 直接接受ASCII str/bytes，省去 b64decode 的参数转换包装层
+    _b64decode = binascii.a2b_base64
+    _b64encode = base64.b64encode
+    _B64_BACKEND = "base64"
+log.info("base64后端: %s", _B64_BACKEND)
+
+# SSE消息JSON解析：优先orjson，其次ujson，最后回退标准库，三者都可直接解析bytes；
+# orjson.JSONDecodeError 是 json.JSONDecodeError 的子类，ujson的解析异常需单独捕获
+_JSON_ERRORS = (json.JSONDecodeError,)
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    try:
+        import ujson
+        _json_loads = ujson.loads
+        _JSON_ERRORS = (json.JSONDecodeError, ujson.JSONDecodeError)
+    except ImportError:
+        _json_loads = json.loads
+
+# 请求体JSON编码：msgspec/orjson直接输出bytes，都未安装时回退标准库
+try:
+    import msgspec
+    _json_encode = msgspec.json.encode
+except ImportError:
+    try:
+        import orjson
+        _json_encode = orjson.dumps
+    except ImportError:
+        def _json_encode(obj):
+            return json.dumps(obj, ensure_ascii=False).encode('utf-8')
+
+
+# 单次响应PCM预分配容量：60秒 @ 24kHz int16
+MAX_RESPONSE_SECONDS = 60
+RESPONSE_SAMPLE_RATE = 24000
+
+# 与服务端协商的裸PCM输出格式（省去每个音频片段的WAV文件头）
+PCM_S16LE = "pcm_s16le"
+
+
+# 采样位宽(字节) -> numpy dtype
+DTYPE_MAP = {1: np.uint8, 2: np.int16, 4: np.int32}
+
+
+def _parse_wav_header(buf):
+    """解析内存中的RIFF/WAVE头，返回 (channels, sample_rate, sample_width, data_offset, data_size)
+
+    标准44字节头直接按固定偏移解析；其余情况逐块遍历，跳过LIST/JUNK等可选块。
+    流式WAV的data长度可能是占位值，按实际剩余长度截断。
+    """
+    # 快速路径：服务端生成的标准44字节头，一次unpack取出全部字段
+    if len(buf) >= _WAV_HEADER.size:
+        (riff, _, wave_id, fmt_id, fmt_size, _, channels, sample_rate, _, _,
+         bits, data_id, data_size) = _WAV_HEADER.unpack_from(buf)
+        if riff == b'RIFF' and wave_id == b'WAVE' and fmt_id == b'fmt ' and fmt_size == 16 and data_id == b'data':
+            return channels, sample_rate, bits // 8, _WAV_HEADER.size, min(data_size, len(buf) - _WAV_HEADER.size)
+
+    mv = memoryview(buf)
+    if len(mv) < 12 or mv[0:4] != b'RIFF' or mv[8:12] != b'WAVE':
+        raise ValueError("不是有效的RIFF/WAVE数据")
+
+    fmt = None
+    pos = 12
+    while pos + 8 <= len(mv):
+        chunk_id = mv[pos:pos + 4]
+        chunk_size = int.from_bytes(mv[pos + 4:pos + 8], 'little')
+        body = pos + 8
+        if chunk_id == b'fmt ':
+            channels = int.from_bytes(mv[body + 2:body + 4], 'little')
+            sample_rate = int.from_bytes(mv[body + 4:body + 8], 'little')
+            sample_width = int.from_bytes(mv[body + 14:body + 16], 'little') // 8
+            fmt = (channels, sample_rate, sample_width)
+        elif chunk_id == b'data':
+            if fmt is None:
+                raise ValueError("data块之前缺少fmt块")
+            data_size = min(chunk_size, len(mv) - body)
+            return fmt + (body, data_size)
+        pos = body + chunk_size + (chunk_size & 1)
+
+    raise ValueError("未找到data块")
+
+
+# 标准44字节PCM WAV头：RIFF块 + 16字节fmt块 + data块头
+_WAV_HEADER = struct.Struct('<4sI4s4sIHHIIHH4sI')
+
+
+def _build_wav_header(channels, sample_rate, sample_width, data_size=0):
+    """构造可复用的44字节PCM WAV头，长度字段可用 _patch_wav_sizes 改写"""
+    header = bytearray(_WAV_HEADER.size)
+    _WAV_HEADER.pack_into(
+        header, 0,
+        b'RIFF', 36 + data_size, b'WAVE',
+        b'fmt ', 16, 1, channels, sample_rate,
+        sample_rate * channels * sample_width, channels * sample_width, sample_width * 8,
+        b'data', data_size
+    )
+    return header
+
+
+def _patch_wav_sizes(header, data_size):
+    """改写WAV头中的RIFF长度和data长度"""
+    struct.pack_into('<I', header, 4, 36 + data_size)
+    struct.pack_into('<I', header, 40, data_size)
+
+
+def _reshape_channels(pcm_array, channels):
+    """多声道PCM整理为 (N, channels) 交错视图（不拷贝），单声道保持1维"""
+    if channels > 1:
+        pcm_array = pcm_array.reshape(-1, channels)
+    return pcm_array
+
+
+def b64decode(data):
+    """base64解码为bytes，使用导入时选定的实现（pybase64优先，否则binascii.a2b_base64）"""
+    return _b64decode(data)
+
+
+def base64_to_pcm(base64_audio_data, audio_format="wav", sample_rate=RESPONSE_SAMPLE_RATE, channels=1):
+    """将base64编码的音频片段解码为PCM数组，失败返回None
+
+    参数含义同 base64_to_pcm_meta，只返回数组本身，供逐帧调用的热路径使用。
+    """
+    return base64_to_pcm_meta(base64_audio_data, audio_format, sample_rate, channels)[0]
+
+
+def base64_to_pcm_meta(base64_audio_data, audio_format="wav", sample_rate=RESPONSE_SAMPLE_RATE, channels=1):
+    """将base64编码的音频片段解码为PCM数组，返回 (pcm_array, sample_rate, channels)
+
+    audio_format 为 "pcm_s16le" 时数据是裸PCM，直接按小端int16解析，
+    sample_rate/channels 取传入值；否则按WAV解析，参数从文件头读取。
+    多声道返回 (N, channels) 的交错视图，单声道返回1维数组。
+    """
+    try:
+        audio_bytes = _b64decode(base64_audio_data)
+    except Exception as e:
+        print(f"Base64解码失败: {e}")
+        return None, None, None
+
+    if audio_format == PCM_S16LE:
+        # 截断到整帧，残缺的尾部字节（奇数长度）直接丢弃，避免frombuffer/reshape抛错
+        count = len(audio_bytes) // (2 * max(channels, 1)) * max(channels, 1)
+        pcm_array = np.frombuffer(audio_bytes, dtype='<i2', count=count)
+        return _reshape_channels(pcm_array, channels), sample_rate, channels
+
+    try:
+        channels, sample_rate, sample_width, data_off, data_size = _parse_wav_header(audio_bytes)
+        dtype = DTYPE_MAP.get(sample_width, np.float32)
+
+        # 直接在解码后的bytes上建视图，不经过wave模块也不拷贝PCM
+        frame_bytes = sample_width * channels
+        count = (data_size // frame_bytes) * channels
+        pcm_array = np.frombuffer(audio_bytes, dtype=dtype, offset=data_off, count=count)
+        return _reshape_channels(pcm_array, channels), sample_rate, channels
+
+    except ValueError:
+        # 非常规头（如扩展fmt）交给wave模块兜底，会多一次PCM拷贝
+        pass
+    except Exception as e:
+        print(f"WAV解析失败: {e}")
+        return None, None, None
+
+    try:
+        with wave.open(io.BytesIO(audio_bytes), 'rb') as wav_file:
+            channels = wav_file.getnchannels()
+            sample_rate = wav_file.getframerate()
+            dtype = DTYPE_MAP.get(wav_file.getsampwidth(), np.float32)
+            pcm_array = np.frombuffer(wav_file.readframes(wav_file.getnframes()), dtype=dtype)
+        return _reshape_channels(pcm_array, channels), sample_rate, channels
+    except Exception as e:
+        print(f"WAV解析失败: {e}")
+        return None, None, None
+
+
+# SSE字段前缀（bytes），逐行比较时无需解码；按规范冒号后的空格可有可无，取值时用 _sse_value 去掉
+_DAT = b'data:'
+_EVT = b'event:'
+_ID = b'id:'
+_RETRY = b'retry:'
+_COMMENT = b':'
+_LEN_DAT = len(_DAT)
+_LEN_EVT = len(_EVT)
+_LEN_ID = len(_ID)
+_LEN_RETRY = len(_RETRY)
+
+
+def _sse_value(line, prefix_len):
+    """取SSE字段值：去掉字段名前缀及紧随其后的一个可选空格"""
+    if line[prefix_len:prefix_len + 1] == b' ':
+        prefix_len += 1
+    return line[prefix_len:]
+
+
+# SSE读取块大小：分块传输下每次返回已到达的数据，不会等满64KB，加大只减少Python层循环次数
+_SSE_READ_SIZE = 64 * 1024
+
+
+def _iter_sse_lines(response, chunk_size=_SSE_READ_SIZE):
+    """按块读取响应并在bytes缓冲区上按换行切分，逐行产出不解码的bytes"""
+    buf = bytearray()
+    for chunk in response.iter_content(chunk_size=chunk_size, decode_unicode=False):
+        buf += chunk
+        start = 0
+        # 经memoryview切片再转bytes，每行只拷贝一次；视图释放后才能改动缓冲区大小
+        with memoryview(buf) as view:
+            while True:
+                idx = buf.find(b'\n', start)
+                if idx < 0:
+                    break
+                yield bytes(view[start:idx])
+                start = idx + 1
+        if start:
+            del buf[:start]
+    if buf:
+        yield bytes(buf)
+
+
+async def _aiter_sse_lines(content):
+    """异步版 _iter_sse_lines：按到达的数据块读取aiohttp响应并在bytes缓冲区上切行，
+    不受aiohttp逐行读取的行长上限限制（base64音频的data行可达数MB）"""
+    buf = bytearray()
+    async for chunk in content.iter_any():
+        buf += chunk
+        start = 0
+        # 经memoryview切片再转bytes，每行只拷贝一次；视图释放后才能改动缓冲区大小
+        with memoryview(buf) as view:
+            while True:
+                idx = buf.find(b'\n', start)
+                if idx < 0:
+                    break
+                yield bytes(view[start:idx])
+                start = idx + 1
+        if start:
+            del buf[:start]
+    if buf:
+        yield bytes(buf)
+
+
+def _build_jit_kernels():
+    """导入numba并定义JIT内核，返回 (stats_i16, stats_i16_par, gain_clip)；numba不可用时返回None
+
+    stats内核单次扫描同时得到 (和, 平方和, 最大绝对值)，全程用int64在寄存器中精确累加
+    （平方和在2^33个样本内不会溢出），不分配临时数组；方差由精确的整数和推出，无需第二遍扫描。
+    gain_clip把增益+饱和截断+转int16融合为一次遍历，不生成乘法/clip临时数组（LLVM会自动向量化）。
+    """
+    try:
+        from numba import njit, prange
+    except ImportError:
+        return None
+
+    @njit(cache=True, fastmath=True)
+    def stats_i16(x):
+        s = np.int64(0)
+        ss = np.int64(0)
+        m = np.int64(0)
+        for i in range(x.size):
+            v = np.int64(x[i])
+            s += v
+            ss += v * v
+            a = v if v >= 0 else -v
+            if a > m:
+                m = a
+        return s, ss, m
+
+    # 长音频用多线程归约；短片段线程调度开销大于计算本身，仍走串行内核
+    @njit(cache=True, fastmath=True, parallel=True)
+    def stats_i16_par(x):
+        s = np.int64(0)
+        ss = np.int64(0)
+        m = np.int64(0)
+        for i in prange(x.size):
+            v = np.int64(x[i])
+            s += v
+            ss += v * v
+            m = max(m, abs(v))
+        return s, ss, m
+
+    @njit(cache=True, fastmath=True)
+    def gain_clip(src, gain, out):
+        for i in range(src.size):
+            v = src[i] * gain
+            if v < -32768.0:
+                v = -32768.0
+            elif v > 32767.0:
+                v = 32767.0
+            out[i] = np.int16(v)
+
+    return stats_i16, stats_i16_par, gain_clip
+
+
+# JIT内核在首次使用时才导入numba（各内核首次调用时编译，cache=True 时后续进程直接加载缓存），
+# 导入本模块不承担numba的加载和编译开销；None表示尚未加载，False表示numba不可用
+_jit_kernels = None
+_jit_kernels_lock = threading.Lock()
+
+
+def _get_jit_kernels():
+    """返回缓存的JIT内核三元组，numba不可用时返回None"""
+    global _jit_kernels
+    if _jit_kernels is None:
+        with _jit_kernels_lock:
+            if _jit_kernels is None:
+                _jit_kernels = _build_jit_kernels() or False
+    return _jit_kernels or None
+
+
+# 样本数超过该值才使用并行内核
+_PARALLEL_MIN_SAMPLES = 1 << 20
+
+
+# 无numba时int16按块升为int64做精确整数归约，块内临时数组约512KB
+_STATS_BLOCK = 1 << 16
+
+
+def _audio_stats(audio_array):
+    """返回int16音频的 (和, 平方和, 最大绝对值)；走JIT内核或分块整数归约，结果为精确的Python int"""
+    flat = audio_array.reshape(-1)
+    kernels = _get_jit_kernels()
+    if kernels is not None:
+        stats_i16, stats_i16_par, _ = kernels
+        kernel = stats_i16_par if flat.size >= _PARALLEL_MIN_SAMPLES else stats_i16
+        s, ss, m = kernel(flat)
+        return int(s), int(ss), int(m)
+    total = 0
+    sum_sq = 0
+    for i in range(0, flat.size, _STATS_BLOCK):
+        blk = flat[i:i + _STATS_BLOCK].astype(np.int64)
+        total += int(blk.sum())
+        sum_sq += int(np.dot(blk, blk))
+    max_abs = max(abs(int(flat.max())), abs(int(flat.min()))) if flat.size else 0
+    return total, sum_sq, max_abs
+
+
+# 无numba时的次选：numexpr把乘法与两级截断编译为分块多线程的单个表达式
+try:
+    import numexpr
+except ImportError:
+    numexpr = None
+
+
+def gain_clip_i16(src, gain, out=None):
+    """src乘以gain后饱和截断到int16范围并转为int16，返回与src同形状的数组"""
+    flat = np.ascontiguousarray(src).reshape(-1)
+    if out is None or out.size < flat.size:
+        out = np.empty(flat.size, dtype=np.int16)
+    else:
+        out = out.reshape(-1)[:flat.size]
+    kernels = _get_jit_kernels() if flat.dtype.kind == 'f' else None
+    if kernels is not None:
+        # 融合内核：增益、饱和截断和转int16一次遍历完成
+        kernels[2](flat, flat.dtype.type(gain), out)
+    elif numexpr is not None:
+        out[:] = numexpr.evaluate(
+            "where(x * g > 32767, 32767, where(x * g < -32768, -32768, x * g))",
+            local_dict={'x': flat, 'g': np.float32(gain)}
+        )
+    else:
+        tmp = np.multiply(flat, gain, dtype=np.float32)
+        np.clip(tmp, -32768, 32767, out=tmp)
+        out[:] = tmp
+    return out.reshape(np.shape(src))
+
+
+class AudioScratch(threading.local):
+    """每个线程一份可复用的float32/int16工作区，只在容量不足时按倍数扩容
+
+    取出的视图在下一次调用前有效，适合解码后立即拷贝或发送的同步调用方。
+    """
+
+    def __init__(self, capacity=RESPONSE_SAMPLE_RATE):
+        self._f32 = np.empty(capacity, dtype=np.float32)
+        self._i16 = np.empty(capacity, dtype=np.int16)
+
+    def f32(self, n):
+        if self._f32.size < n:
+            self._f32 = np.empty(max(n, self._f32.size * 2), dtype=np.float32)
+        return self._f32[:n]
+
+    def i16(self, n):
+        if self._i16.size < n:
+            self._i16 = np.empty(max(n, self._i16.size * 2), dtype=np.int16)
+        return self._i16[:n]
+
+
+# /api/v1/stream 请求体模板：依次填入 base64音频、毫秒时间戳、可选尾部字段
+_STREAM_BODY_TEMPLATE = (
+    b'{"messages":[{"role":"user","content":[{"type":"input_audio",'
+    b'"input_audio":{"data":"%b","format":"wav","timestamp":"%b"}}]}],'
+    b'"end_of_stream":false%b}'
+)
+
+
+# 回调队列满时入队的最长等待秒数：回调短暂变慢时不丢帧，回调线程已退出时也不会永久阻塞
+_CALLBACK_PUT_TIMEOUT = 2.0
+
+
+def _put_frame(q, item):
+    """带超时的阻塞入队，成功返回True；等待超时（回调长时间不取）时放弃该项返回False"""
+    try:
+        q.put(item, timeout=_CALLBACK_PUT_TIMEOUT)
+        return True
+    except queue.Full:
+        return False
+
+
+def _put_drop_oldest(q, item):
+    """非阻塞入队；队列满时丢弃最旧的一项，只用于投递退出信号"""
+    while True:
+        try:
+            q.put_nowait(item)
+            return
+        except queue.Full:
+            try:
+                q.get_nowait()
+            except queue.Empty:
+                pass
+
+
+def _callback_worker(q, callback):
+    """从队列取数据调用回调，收到None时退出"""
+    while True:
+        item = q.get()
+        if item is None:
+            break
+        try:
+            callback(item)
+        except Exception as e:
+            print(f"回调处理错误: {e}")
+
+
+# 回调队列容量（帧/条）
+_CALLBACK_QUEUE_SIZE = 64
+
+# 音频回调一次最多合并的积压帧数
+_COALESCE_MAX_FRAMES = 8
+
+
+def _audio_callback_worker(q, callback):
+    """音频回调线程：取到一帧后顺带取走队列中已积压的帧（不额外等待），
+    合并成一段连续PCM再回调一次，消费跟不上时减少回调次数；收到None时退出"""
+    while True:
+        item = q.get()
+        if item is None:
+            break
+        batch = [item]
+        stop = False
+        while len(batch) < _COALESCE_MAX_FRAMES:
+            try:
+                nxt = q.get_nowait()
+            except queue.Empty:
+                break
+            if nxt is None:
+                stop = True
+                break
+            batch.append(nxt)
+        try:
+            callback(batch[0] if len(batch) == 1 else np.concatenate(batch))
+        except Exception as e:
+            print(f"回调处理错误: {e}")
+        if stop:
+            break
+
+
+# 表示响应结束的 finish_reason 取值
+_FINISH_REASONS = frozenset(('stop', 'completed', 'done'))
+
+
+# 空choice共享实例，避免每帧分配临时的 [{}]
+_EMPTY_CHOICE = {}
+
+
+def _extract_choice(data):
+    """取出SSE消息首个choice中的 (audio, text, finish_reason)，缺失字段返回空串"""
+    choices = data.get('choices')
+    choice = choices[0] if choices else _EMPTY_CHOICE
+    return choice.get('audio', ''), choice.get('text', ''), choice.get('finish_reason', '')
+
+
+# libsndfile subtype -> 源文件采样位宽(字节)
+_SUBTYPE_WIDTH = {
+    'PCM_S8': 1, 'PCM_U8': 1, 'PCM_16': 2, 'PCM_24': 3, 'PCM_32': 4,
+    'FLOAT': 4, 'DOUBLE': 8,
+}
+
+
+def _analyze_wav_file(audio_file):
+    """分析WAV文件的音频质量指标，失败返回None"""
+    try:
+        # libsndfile直接解码到int16数组，统一按16位幅度尺度分析；
+        # sample_width 报告源文件的实际位宽
+        with sf.SoundFile(audio_file) as snd_file:
+            # 获取音频参数
+            frames = snd_file.frames
+            sample_rate = snd_file.samplerate
+            channels = snd_file.channels
+            sample_width = _SUBTYPE_WIDTH.get(snd_file.subtype, 2)
+            duration = frames / sample_rate
+            
+            # 读取音频数据
+            audio_array = snd_file.read(dtype='int16', always_2d=False)
+            
+            # 计算音频质量指标：单次扫描得到精确整数和，方差由 (n·Σx² - (Σx)²)/n² 推出
+            n = audio_array.size
+            total, sum_sq, max_amplitude = _audio_stats(audio_array)
+            signal_power = sum_sq / n
+            rms = math.sqrt(signal_power)
+            
+            # 计算信噪比估计
+            # 整数运算下分子精确，避免 E[x²]-E[x]² 在浮点中的相消误差
+            noise_estimate = max((n * sum_sq - total * total) / (n * n), 0.0)
+            if signal_power > 0:
+                snr_estimate = 10 * math.log10(signal_power / (noise_estimate + 1e-10))
+            else:
+                snr_estimate = float('-inf')
+            
+            quality_info = {
+                'duration': duration,
+                'sample_rate': sample_rate,
+                'channels': channels,
+                'sample_width': sample_width,
+                'frames': frames,
+                'rms': rms,
+                'max_amplitude': max_amplitude,
+                'snr_estimate': snr_estimate,
+                'dynamic_range': max_amplitude / (rms + 1e-10)
+            }
+            
+            return quality_info
+            
+    except Exception as e:
+        print(f"音频质量分析失败: {e}")
+        return None
+
+
+@functools.lru_cache(maxsize=32)
+def _cached_audio_quality(audio_file, mtime_ns, size):
+    """按 (路径, 修改时间, 大小) 缓存音频质量分析结果，文件变化后自动失效"""
+    return _analyze_wav_file(audio_file)
+
+
+# 分段编码的步长必须是3的倍数，中间段才不会产生'='填充
+_B64_STEP = 57 * 1024
+
+
+def _b64encode_mapped(buf):
+    """分段base64编码，输出写入预分配的bytearray，不需要整份原始数据的bytes副本"""
+    n = len(buf)
+    out = bytearray(4 * ((n + 2) // 3))
+    view = memoryview(buf)
+    pos = 0
+    for i in range(0, n, _B64_STEP):
+        piece = _b64encode(view[i:i + _B64_STEP])
+        out[pos:pos + len(piece)] = piece
+        pos += len(piece)
+    view.release()
+    return out.decode('ascii')
+
+
+@functools.lru_cache(maxsize=32)
+def _cached_load_audio_b64(file_path, mtime_ns, size):
+    """按 (路径, 修改时间, 大小) 缓存音频文件的base64编码结果"""
+    with open(file_path, "rb") as f:
+        if size == 0:
+            return ""
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return _b64encode_mapped(mm)
+
+
+def _encode_wav_chunks(pcm, frames, channels, sample_rate, sample_width, num_chunks):
+    """把字节视图形式的PCM按帧均分为num_chunks段，每段拼上WAV头后base64编码"""
+    frame_bytes = channels * sample_width
+    # 按帧预先计算片段边界，保证不会在一帧中间切开
+    boundaries = np.linspace(0, frames, num_chunks + 1, dtype=np.int64)
+    header = _build_wav_header(channels, sample_rate, sample_width)
+    
+    chunks = []
+    for i in range(num_chunks):
+        start, end = int(boundaries[i]), int(boundaries[i + 1])
+        
+        # 零拷贝的字节视图，只在与WAV头拼接时复制一次
+        with pcm[start * frame_bytes:end * frame_bytes] as chunk_data:
+            chunk_size = chunk_data.nbytes
+            # 所有片段共用一个WAV头，只改写长度字段后直接拼接PCM
+            _patch_wav_sizes(header, chunk_size)
+            chunk_base64 = _b64encode(header + chunk_data).decode('ascii')
+        
+        chunks.append({
+            'index': i + 1,
+            'data': chunk_base64,
+            'size': chunk_size,
+            'duration': (end - start) / sample_rate
+        })
+    return chunks
+
+
+def _split_wav_mapped(audio_file, num_chunks):
+    """内存映射16位PCM WAV并直接切分data块；不是此类文件时返回None"""
+    with open(audio_file, 'rb') as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # 空文件无法映射
+            return None
+        with mm:
+            try:
+                channels, sample_rate, sample_width, data_off, data_size = _parse_wav_header(mm)
+            except ValueError:
+                return None
+            if sample_width != 2:
+                return None
+            frames = data_size // (channels * sample_width)
+            with memoryview(mm) as mv, mv[data_off:data_off + frames * channels * sample_width] as pcm:
+                return _encode_wav_chunks(pcm, frames, channels, sample_rate, sample_width, num_chunks)
+
 def save_pcm_as_wav(pcm_data, sample_rate, channels, output_file):
     """将PCM数据保存为WAV文件"""
     try:
-        # 使用soundfile保存
-        sf.write(output_file, pcm_data, sample_rate)
+        # 使用soundfile保存，显式指定PCM_16避免按dtype推断格式
+        sf.write(output_file, pcm_data, sample_rate, subtype='PCM_16')
         print(f"音频已保存到: {output_file}")
     except Exception as e:
         print(f"保存音频失败: {e}")
 
 
+class ExitReason(IntEnum):
+    """监听器退出原因，同步/异步客户端共用"""
+    MANUAL_STOP = 0
+    END_SIGNAL = 1
+    STREAM_ENDED = 2
+    TIMEOUT = 3
+    CONNECTION_ERROR = 4
+    SERVER_DISCONNECT = 5
+    REQUEST_ERROR = 6
+    EXCEPTION = 7
+    UNKNOWN = 8
+
+
+# 按ExitReason下标查表：重启延迟（秒）
+_EXIT_DELAYS = (
+    0,   # 手动停止，不重启
+    1,   # 正常结束，快速重启
+    1,   # 流结束，快速重启
+    5,   # 超时，延迟重启
+    10,  # 连接错误，较长延迟
+    3,   # 服务器断开，中等延迟
+    8,   # 请求错误，较长延迟
+    5,   # 异常，中等延迟
+    5,   # 未知，中等延迟
+)
+
+# 按ExitReason下标查表：退出原因说明
+_EXIT_MESSAGES = (
+    "🛑 手动停止",
+    "🏁 正常完成（收到结束信号）",
+    "📡 服务器流结束",
+    "⏰ 连接超时",
+    "🔌 网络连接问题",
+    "🔌 服务器主动断开连接",
+    "🌐 网络请求错误",
+    "💥 程序异常",
+    "❓ 未知原因",
+)
+
+# VAD阈值线性策略：基准阈值减去各质量特征（时长<2s、RMS<1000、SNR<10dB、动态范围<2）的加权和
+_VAD_BASE = 0.8
+_VAD_W = np.array([0.2, 0.1, 0.1, 0.1])
+
+# 监听线程待处理消息上限，超过时丢弃新消息
+_MESSAGE_QUEUE_SIZE = 1000
+
+# 音频片段上传的默认并发数：服务端按到达顺序拼接片段，默认串行以保证顺序，
+# 由连接池/信号量限制在途请求数，不再用固定sleep节流
+UPLOAD_CONCURRENCY = 1
+
+# completions事件流请求头
+_SSE_HEADERS = {
+    "Accept": "text/event-stream",
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive"
+}
+
+# 预编码请求体的请求头
+_JSON_HEADERS = {"Content-Type": "application/json"}
+
+
 class MiniCPMClient:
-    def __init__(self, base_url="http://localhost:32550", volume_gain=2.0):
+    def __init__(self, base_url="http://localhost:32550", volume_gain=2.0, response_audio_format=None):
         self.base_url = base_url
         self.session = requests.Session()
         self.uid = str(uuid.uuid4())
+
+        # 固定请求头只在会话上设置一次，避免每次请求重建和校验headers
+        self.session.headers.update({
+            "uid": self.uid,
+            "Content-Type": "application/json"
+        })
+        # SSE长连接使用独立会话，携带事件流所需的请求头
+        self._sse_session = requests.Session()
+        self._sse_session.headers.update(_SSE_HEADERS)
+        self._sse_session.headers["uid"] = self.uid
+
+        # 期望的返回音频格式，设为 PCM_S16LE 时请求服务端直接返回裸PCM；
+        # 服务端不支持时仍返回WAV，解码端按帧中的 format 字段自动回退
+        self.response_audio_format = response_audio_format
+        # 上传请求体模板的尾部（可选的输出格式声明），只编码一次
+        self._stream_body_tail = b''
+        if response_audio_format:
+            self._stream_body_tail = b',"output_audio":' + _json_encode({
+                "format": response_audio_format,
+                "sample_rate": RESPONSE_SAMPLE_RATE,
+                "channels": 1
+            })
         self.responses = []
         self.session_id = None
         
@@ -42,68 +766,105 @@ class MiniCPMClient:
         self.auto_restart_listener = True
         self.current_audio_callback = None
         self.current_text_callback = None
+        self._restart_timer = None  # 当前待触发的自动重启定时器（新建前先取消旧的）
+        self._restart_reason = ExitReason.UNKNOWN
         
         # 性能优化：消息队列和处理线程
-        self.message_queue = queue.Queue(maxsize=1000)  # 消息缓冲队列
+        # 监听线程与处理线程之间用deque交接：append/popleft在GIL下是原子的，
+        # 只有队列为空时才通过Event等待，省去Queue每次put/get的锁与条件变量
+        self.message_queue = collections.deque()  # 消息缓冲队列
+        self._msg_event = threading.Event()
         self.processor_thread = None
         self.should_stop_processing = False
+        # 当前处理线程对应的 (音频回调, 文本回调)，自动重启时据此判断能否沿用
+        self._processor_callbacks = None
+
+        # SSE监听到的音频/文本先进入有界队列，由独立线程调用回调；
+        # 每次重启回调线程都换一组新队列（见 _start_callback_workers）
+        self._audio_q = queue.Queue(maxsize=_CALLBACK_QUEUE_SIZE)
+        self._text_q = queue.Queue(maxsize=_CALLBACK_QUEUE_SIZE)
+        self._callback_threads = []
+        # 回调长时间积压导致放弃投递的音频帧数（get_response_pcm 中仍保留这些帧）
+        self._dropped_audio_frames = 0
+
+        # 预分配的响应PCM缓冲区，每次请求只重置写指针，避免反复扩容拷贝
+        self._pcm_pool = np.empty(MAX_RESPONSE_SECONDS * RESPONSE_SAMPLE_RATE * 2, dtype=np.uint8)
+        self._pcm_end = 0
 
     def set_session_id(self, session_id):
         self.session_id = session_id
 
+    def close(self):
+        """停止监听并释放HTTP连接池"""
+        self.auto_restart_listener = False
+        self.stop_completions_listener()
+        self._stop_callback_workers()
+        self.session.close()
+        self._sse_session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _reset_response_pcm(self):
+        """新请求开始时重置PCM写指针"""
+        self._pcm_end = 0
+
+    def _append_response_pcm(self, pcm):
+        """把一段PCM（任意支持缓冲区协议的对象）按字节追加到预分配缓冲区
+
+        逐片段只做一次memoryview字节拷贝，不经过numpy；
+        转换成int16数组统一在 get_response_pcm 中完成一次。
+        """
+        raw = memoryview(pcm).cast('B')
+        end = self._pcm_end + raw.nbytes
+        if end > self._pcm_pool.size:
+            grown = np.empty(max(end, self._pcm_pool.size * 2), dtype=np.uint8)
+            grown[:self._pcm_end] = self._pcm_pool[:self._pcm_end]
+            self._pcm_pool = grown
+        memoryview(self._pcm_pool)[self._pcm_end:end] = raw
+        self._pcm_end = end
+
+    def get_response_pcm(self):
+        """返回本次响应累计的int16 PCM（缓冲区视图，下次请求会被覆盖）"""
+        return self._pcm_pool[:self._pcm_end].view('<i2')
+
     def load_audio_file(self, file_path):
-        """加载音频文件并转换为base64"""
-        with open(file_path, "rb") as f:
-            audio_data = base64.b64encode(f.read()).decode('utf-8')
-        return audio_data
+        """加载音频文件并转换为base64（同一未修改文件复用缓存结果）"""
+        st = os.stat(file_path)
+        return _cached_load_audio_b64(file_path, st.st_mtime_ns, st.st_size)
         
     def check_service_status(self):
         """检查服务状态"""
-        response = requests.get(f"{self.base_url}/health")
+        response = self.session.get(f"{self.base_url}/health", timeout=10)
         return response
         
     def send_audio_with_completion_flag(self, audio_data, end_of_stream=True):
         """发送音频并明确标记是否为流的结束"""
-        stream_data = {
-            "messages": [{
-                "role": "user",
-                "content": [{
-                    "type": "input_audio", 
-                    "input_audio": {
-                        "data": audio_data,
-                        "format": "wav",
-                        "timestamp": str(int(time.time() * 1000))
-                    }
-                }]
-            }],
-            "end_of_stream": False
-        }
-        
-        headers = {
-            "uid": self.uid,
-            "Content-Type": "application/json"
-        }
+        # base64字符集无需JSON转义，直接把音频拼进预编码的请求体模板
+        if isinstance(audio_data, str):
+            audio_data = audio_data.encode('ascii')
+        timestamp = b'%d' % (time.time_ns() // 1_000_000)
+        body = _STREAM_BODY_TEMPLATE % (audio_data, timestamp, self._stream_body_tail)
         
         response = self.session.post(
             f"{self.base_url}/api/v1/stream",
-            headers=headers,
-            json=stream_data,
+            data=body,
             timeout=30
         )
 
         return response.json()
 
+    @staticmethod
+    def set_debug(enabled):
+        """开启/关闭监听路径的逐帧调试日志"""
+        set_debug(enabled)
+
     def send_completions_request(self) -> requests.Response:
-        headers = {
-            "uid": self.uid,
-            "Accept": "text/event-stream",
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive"
-        }
-        
-        response = self.session.post(
+        response = self._sse_session.post(
             f"{self.base_url}/api/v1/completions",
-            headers=headers,
             json={},
             stream=True,
             timeout=(10, 900)
@@ -114,6 +875,8 @@ class MiniCPMClient:
     def stop_completions_listener(self):
         """停止completions监听器"""
         self.should_stop_listening = True
+        if self._restart_timer is not None:
+            self._restart_timer.cancel()
         
         # 停止消息处理线程
         self._stop_message_processor()
@@ -127,11 +890,7 @@ class MiniCPMClient:
             print("🛑 设置停止标志...")
             
         # 清空消息队列
-        try:
-            while not self.message_queue.empty():
-                self.message_queue.get_nowait()
-        except queue.Empty:
-            pass
+        self.message_queue.clear()
 
     def restart_completions_listener(self):
         """重启completions监听器"""
@@ -177,7 +936,7 @@ class MiniCPMClient:
         self._start_message_processor(on_audio_done, on_text_done)
         
         def listen():
-            exit_reason = "unknown"  # 记录退出原因
+            exit_reason = ExitReason.UNKNOWN  # 记录退出原因
             connection_error = None  # 记录连接错误
             
             try:
@@ -187,85 +946,89 @@ class MiniCPMClient:
                 # SSE消息缓冲
                 current_event = None
                 current_data = None
+                frame_count = 0
 
-                for line in response.iter_lines():
+                for line in _iter_sse_lines(response):
                     # 检查是否需要停止
                     if self.should_stop_listening:
-                        exit_reason = "manual_stop"
+                        exit_reason = ExitReason.MANUAL_STOP
                         print("🛑 收到停止信号，退出监听")
                         break
 
-                    # 如果服务器发送非 UTF-8 数据
-                    try:
-                        line_text = line.decode().strip()
-                    except UnicodeDecodeError as e:
-                        print(f"解码错误: {e}")
-                        continue
+                    # 保持bytes，只在需要时解码
+                    line = line.strip()
 
                     # 跳过空行
-                    if not line_text:
+                    if not line:
                         continue
-                        
+
                     # 解析事件类型
-                    if line_text.startswith("event: "):
-                        current_event = line_text[7:]  # 去掉 "event: "
-                        print(f"📋 事件类型: {current_event}")
-                    elif line_text.startswith("data: "):
-                        current_data = line_text[6:]  # 去掉 "data: "
-                        
+                    if line.startswith(_DAT):
+                        current_data = _sse_value(line, _LEN_DAT)  # 去掉 "data:" 前缀，保持bytes直接交给JSON解析
+
                         # 检查结束条件
-                        if ('<end>' in current_data):
+                        if b'<end>' in current_data:
                             print("🏁 检测到结束标志，停止接收")
-                            exit_reason = "end_signal"
+                            exit_reason = ExitReason.END_SIGNAL
                             break
-                        
+
                         # 放入队列处理
-                        try:
-                            self.message_queue.put(current_data, timeout=0.01)
-                        except queue.Full:
+                        frame_count += 1
+                        if len(self.message_queue) >= _MESSAGE_QUEUE_SIZE:
                             print("⚠️ 消息队列已满，跳过消息")
                             continue
-                        except Exception as e:
-                            print(f"队列操作错误: {e}")
-                        
+                        self.message_queue.append(current_data)
+                        self._msg_event.set()
+
+                    elif line.startswith(_EVT):
+                        current_event = _sse_value(line, _LEN_EVT)  # 去掉 "event:" 前缀
+                        if _DEBUG:
+                            log.debug("事件类型: %s", current_event.decode('ascii', 'replace'))
+
                     # 解析其他SSE字段
-                    elif line_text.startswith("id: "):
-                        message_id = line_text[4:]
-                        print(f"🆔 消息ID: {message_id}")
-                        
-                    elif line_text.startswith("retry: "):
-                        retry_time = line_text[7:]
-                        print(f"⏰ 重试间隔: {retry_time}ms")
-                        
-                    else:
-                        print(f"❓ 未知格式: {line_text}")
+                    elif line.startswith(_ID):
+                        if _DEBUG:
+                            log.debug("消息ID: %s", _sse_value(line, _LEN_ID).decode('utf-8', 'replace'))
+
+                    elif line.startswith(_RETRY):
+                        if _DEBUG:
+                            log.debug("重试间隔: %sms", _sse_value(line, _LEN_RETRY).decode('ascii', 'replace'))
+
+                    elif line.startswith(_COMMENT):
+                        # SSE注释/keepalive，无需解码
+                        continue
+
+                    elif _DEBUG:
+                        log.debug("未知格式: %r", line)
+
+                print(f"📊 本次连接共接收 {frame_count} 条消息")
 
                 # 如果循环正常结束且没有设置退出原因，说明是流结束
-                if exit_reason == "unknown":
-                    exit_reason = "stream_ended"
+                if exit_reason == ExitReason.UNKNOWN:
+                    exit_reason = ExitReason.STREAM_ENDED
                     
             except requests.exceptions.Timeout as e:
-                exit_reason = "timeout"
+                exit_reason = ExitReason.TIMEOUT
                 connection_error = f"连接超时: {e}"
                 print(f"⏰ 连接超时: {e}")
                 
             except requests.exceptions.ConnectionError as e:
-                exit_reason = "connection_error"
+                exit_reason = ExitReason.CONNECTION_ERROR
                 connection_error = f"连接错误: {e}"
                 print(f"🔌 连接错误: {e}")
                 
             except requests.exceptions.ChunkedEncodingError as e:
-                exit_reason = "server_disconnect"
+                exit_reason = ExitReason.SERVER_DISCONNECT
                 connection_error = f"服务器断开连接: {e}"
                 print(f"🔌 服务器断开连接: {e}")
                 
             except requests.exceptions.RequestException as e:
-                exit_reason = "request_error"
+                exit_reason = ExitReason.REQUEST_ERROR
                 connection_error = f"请求错误: {e}"
                 print(f"🌐 网络请求错误: {e}")
 
             except Exception as e:
-                exit_reason = "exception"
+                exit_reason = ExitReason.EXCEPTION
                 connection_error = f"监听异常: {e}"
                 print(f"💥 Completions监听错误: {e}")
             
@@ -280,23 +1043,30 @@ class MiniCPMClient:
         """启动消息处理线程，专门处理从队列中取出的消息"""
         def process_messages():
             print("🔧 消息处理线程启动")
+            pending = self.message_queue
+            event = self._msg_event
             
             while not self.should_stop_processing:
                 try:
-                    # 从队列中获取消息，设置超时避免无限阻塞
-                    message_data = self.message_queue.get(timeout=1.0)
+                    if not pending:
+                        # 先清除再复查，避免清除掉入队后刚设置的信号；超时避免无限阻塞
+                        event.clear()
+                        if not pending:
+                            event.wait(timeout=1.0)
+                        continue
+                    
+                    # 每次循环取出一条；积压未取完前不会再等待信号
+                    message_data = pending.popleft()
                     
                     if message_data is None:  # 退出信号
                         break
                     
                     # 处理消息
                     try:
-                        data = json.loads(message_data)
+                        data = _json_loads(message_data)
                         
                         completed = data.get('completed', False)
-                        choice = data.get('choices', [{}])[0]
-                        audio_base64 = choice.get('audio', '')
-                        text = choice.get('text', '')
+                        audio_base64, text, _ = _extract_choice(data)
                         
                         if completed:
                             print(f"🏁 全部发送完毕，统计数据{data}")
@@ -312,30 +1082,37 @@ class MiniCPMClient:
 
                         # 处理音频数据（这里可能比较慢）
                         if audio_base64:
-                            print(f"📦 收到音频片段: {len(audio_base64)} 字符")
-                            on_audio_done(audio_base64)
+                            if _DEBUG:
+                                log.debug("收到音频片段: %d 字符", len(audio_base64))
+                            # 交给音频回调线程按序处理（队列满时阻塞形成背压，不丢帧）
+                            # 每次取当前这一代回调线程的队列，回调线程重启后不会投递到已退出的旧队列
+                            self._audio_q.put(audio_base64)
                             
                         # 处理文本数据
                         # if text and text != '\n<end>':
                         #     print(f"💬 收到文本: {text}")
                         #     on_text_done(text)
                             
-                    except json.JSONDecodeError as e:
+                    except _JSON_ERRORS as e:
                         print(f"JSON解析错误: {e}, 数据: {message_data}")
                     except Exception as e:
                         print(f"消息处理错误: {e}")
                     
-                    # 标记任务完成
-                    self.message_queue.task_done()
-                    
-                except queue.Empty:
-                    # 超时，继续循环
-                    continue
                 except Exception as e:
                     print(f"消息处理器错误: {e}")
                     
             print("🔧 消息处理线程结束")
         
+        callbacks = (on_audio_done, on_text_done)
+        if self.processor_thread is not None and self.processor_thread.is_alive():
+            if callbacks == self._processor_callbacks:
+                # 自动重启时沿用仍在运行的处理线程和回调线程：始终只有一个处理线程按序取消息
+                return
+            self._stop_message_processor()
+        self._processor_callbacks = callbacks
+
+        # 解码/播放等耗时回调放到单独线程，处理线程只负责JSON解析
+        self._start_callback_workers(on_audio_done, on_text_done, coalesce_audio=False)
         self.should_stop_processing = False
         self.processor_thread = threading.Thread(target=process_messages)
         self.processor_thread.daemon = True
@@ -346,162 +1123,91 @@ class MiniCPMClient:
         self.should_stop_processing = True
         
         # 发送退出信号
-        try:
-            self.message_queue.put(None, timeout=0.1)
-        except queue.Full:
-            pass
+        self.message_queue.append(None)
+        self._msg_event.set()
         
         if self.processor_thread and self.processor_thread.is_alive():
             self.processor_thread.join(timeout=3)
+        if not (self.processor_thread and self.processor_thread.is_alive()):
+            # 处理线程已退出：清掉剩余消息和未取走的退出信号，避免新处理线程一启动就取到None
+            self.message_queue.clear()
+            self._processor_callbacks = None
+        self._stop_callback_workers()
 
     def _handle_listener_exit(self, exit_reason, connection_error=None):
-        """处理监听器退出，根据不同原因采取不同策略"""
+        """处理监听器退出，根据不同原因（ExitReason）采取不同策略"""
         print("📻 监听线程结束")
-        
-        # 根据退出原因提供详细信息
-        exit_messages = {
-            "manual_stop": "🛑 手动停止",
-            "end_signal": "🏁 正常完成（收到结束信号）",
-            "stream_ended": "📡 服务器流结束",
-            "timeout": "⏰ 连接超时",
-            "connection_error": "🔌 网络连接问题",
-            "server_disconnect": "🔌 服务器主动断开连接",
-            "request_error": "🌐 网络请求错误", 
-            "exception": "💥 程序异常",
-            "unknown": "❓ 未知原因"
-        }
-        
-        print(f"🔍 退出原因: {exit_messages.get(exit_reason, exit_reason)}")
+        print(f"🔍 退出原因: {_EXIT_MESSAGES[exit_reason]}")
         if connection_error:
             print(f"🔍 详细信息: {connection_error}")
         
-        # 决定是否重启
-        should_restart = self.auto_restart_listener and not self.should_stop_listening
-        
-        # 根据不同退出原因设置不同的重启延迟
-        restart_delays = {
-            "manual_stop": 0,      # 手动停止，不重启
-            "end_signal": 1,       # 正常结束，快速重启
-            "stream_ended": 1,     # 流结束，快速重启
-            "timeout": 5,          # 超时，延迟重启
-            "connection_error": 10, # 连接错误，较长延迟
-            "server_disconnect": 3, # 服务器断开，中等延迟
-            "request_error": 8,    # 请求错误，较长延迟
-            "exception": 5,        # 异常，中等延迟
-            "unknown": 5           # 未知，中等延迟
-        }
-        
         # 手动停止不重启
-        if exit_reason == "manual_stop":
-            should_restart = False
+        should_restart = (self.auto_restart_listener and not self.should_stop_listening
+                          and exit_reason != ExitReason.MANUAL_STOP)
         
         if should_restart:
-            delay = restart_delays.get(exit_reason, 5)
+            delay = _EXIT_DELAYS[exit_reason]
             print(f"🔄 {delay}秒后自动重启监听器...")
             
-            # 创建延迟重启线程，避免线程自join问题
-            def delayed_restart():
-                time.sleep(delay)
-                if self.auto_restart_listener and not self.should_stop_listening:
-                    print(f"🚀 重新启动监听器（原因：{exit_messages.get(exit_reason, exit_reason)}）...")
-                    self.start_completions_listener(
-                        self.current_audio_callback, 
-                        self.current_text_callback, 
-                        self.auto_restart_listener
-                    )
-            
-            restart_thread = threading.Thread(target=delayed_restart)
-            restart_thread.daemon = True
-            restart_thread.start()
+            # 用定时器延迟重启，避免线程自join问题；threading.Timer不可复用，
+            # 每次新建一个，并先取消尚未触发的旧定时器，保证同一时刻只有一个待重启
+            if self._restart_timer is not None:
+                self._restart_timer.cancel()
+            self._restart_reason = exit_reason
+            self._restart_timer = threading.Timer(delay, self._do_restart)
+            self._restart_timer.daemon = True
+            self._restart_timer.start()
         else:
             print("🚫 不会自动重启监听器")
 
+    def _do_restart(self):
+        """定时器回调：仍需自动重启时重新启动监听器"""
+        if self.auto_restart_listener and not self.should_stop_listening:
+            print(f"🚀 重新启动监听器（原因：{_EXIT_MESSAGES[self._restart_reason]}）...")
+            self.start_completions_listener(
+                self.current_audio_callback, 
+                self.current_text_callback, 
+                self.auto_restart_listener
+            )
+
     def analyze_audio_quality(self, audio_file):
-        """分析音频质量，返回关键指标"""
+        """分析音频质量，返回关键指标（同一未修改文件只分析一次）"""
         try:
-            with wave.open(audio_file, 'rb') as wav_file:
-                # 获取音频参数
-                frames = wav_file.getnframes()
-                sample_rate = wav_file.getframerate()
-                channels = wav_file.getnchannels()
-                sample_width = wav_file.getsampwidth()
-                duration = frames / sample_rate
-                
-                # 读取音频数据
-                audio_data = wav_file.readframes(frames)
-                
-                # 转换为numpy数组进行分析
-                if sample_width == 1:
-                    audio_array = np.frombuffer(audio_data, dtype=np.uint8)
-                elif sample_width == 2:
-                    audio_array = np.frombuffer(audio_data, dtype=np.int16)
-                elif sample_width == 4:
-                    audio_array = np.frombuffer(audio_data, dtype=np.int32)
-                else:
-                    audio_array = np.frombuffer(audio_data, dtype=np.float32)
-                
-                # 计算音频质量指标
-                rms = np.sqrt(np.mean(audio_array.astype(np.float64) ** 2))
-                max_amplitude = np.max(np.abs(audio_array))
-                
-                # 计算信噪比估计
-                signal_power = np.mean(audio_array.astype(np.float64) ** 2)
-                noise_estimate = np.var(audio_array.astype(np.float64))
-                snr_estimate = 10 * np.log10(signal_power / (noise_estimate + 1e-10))
-                
-                quality_info = {
-                    'duration': duration,
-                    'sample_rate': sample_rate,
-                    'channels': channels,
-                    'sample_width': sample_width,
-                    'frames': frames,
-                    'rms': rms,
-                    'max_amplitude': max_amplitude,
-                    'snr_estimate': snr_estimate,
-                    'dynamic_range': max_amplitude / (rms + 1e-10)
-                }
-                
-                return quality_info
-                
-        except Exception as e:
+            st = os.stat(audio_file)
+        except OSError as e:
             print(f"音频质量分析失败: {e}")
             return None
+        quality_info = _cached_audio_quality(audio_file, st.st_mtime_ns, st.st_size)
+        # 返回副本，调用方修改结果不会污染缓存
+        return dict(quality_info) if quality_info else None
 
 
     def suggest_vad_threshold(self, quality_info):
         """根据音频质量建议VAD阈值"""
         if not quality_info:
-            return 0.8  # 默认值
+            return _VAD_BASE  # 默认值
         
-        # 基于音频质量动态调整VAD阈值
-        base_threshold = 0.8
+        # 每个条件成立记1，按权重从基准阈值中扣减：时长太短、音量小、信噪比低、动态范围低
+        feats = np.array([
+            quality_info['duration'] < 2.0,
+            quality_info['rms'] < 1000,
+            quality_info['snr_estimate'] < 10,
+            quality_info['dynamic_range'] < 2.0
+        ], dtype=np.float64)
         
-        # 如果音频时长太短，降低阈值
-        if quality_info['duration'] < 2.0:
-            base_threshold -= 0.2
-            
-        # 如果RMS值较低（音量小），降低阈值
-        if quality_info['rms'] < 1000:
-            base_threshold -= 0.1
-            
-        # 如果信噪比较低，降低阈值
-        if quality_info['snr_estimate'] < 10:
-            base_threshold -= 0.1
-            
-        # 如果动态范围较低，降低阈值
-        if quality_info['dynamic_range'] < 2.0:
-            base_threshold -= 0.1
-            
         # 确保阈值在合理范围内
-        suggested_threshold = max(0.1, min(0.9, base_threshold))
-        
-        return suggested_threshold
+        return float(np.clip(_VAD_BASE - feats @ _VAD_W, 0.1, 0.9))
 
 
-    def init_with_adaptive_vad(self, audio_file):
+    def init_with_adaptive_vad(self, audio_file, voice_clone_prompt="", assistant_prompt="", enable_silence_filtering=False):
         """使用自适应VAD阈值初始化客户端"""
         print("🔍 分析音频质量...")
-        quality_info = self.analyze_audio_quality(audio_file)
+        # 质量分析与base64编码互不依赖，并行执行；编码结果进入缓存，初始化时直接命中
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            fut_b64 = pool.submit(self.load_audio_file, audio_file)
+            fut_quality = pool.submit(self.analyze_audio_quality, audio_file)
+            quality_info = fut_quality.result()
+            fut_b64.result()
         
         if quality_info:
             print(f"📊 音频质量分析结果:")
@@ -510,16 +1216,16 @@ class MiniCPMClient:
             print(f"   RMS: {quality_info['rms']:.2f}")
             print(f"   信噪比估计: {quality_info['snr_estimate']:.2f}dB")
             print(f"   动态范围: {quality_info['dynamic_range']:.2f}")
-            
-            # 基于质量分析建议VAD阈值
-            suggested_threshold = self.suggest_vad_threshold(quality_info)
-            print(f"💡 建议VAD阈值: {suggested_threshold:.2f}")
-            
-            # 使用建议的阈值初始化
-            return self.init_with_custom_vad_threshold(audio_file, suggested_threshold)
         else:
             print("⚠️ 无法分析音频质量，使用默认阈值")
-            return self.init_with_chinese_voice(audio_file)
+        
+        # 基于质量分析建议VAD阈值（无法分析时返回默认值）
+        suggested_threshold = self.suggest_vad_threshold(quality_info)
+        print(f"💡 建议VAD阈值: {suggested_threshold:.2f}")
+        
+        return self.init_with_custom_vad_threshold(
+            audio_file, suggested_threshold, voice_clone_prompt, assistant_prompt, enable_silence_filtering
+        )
 
 
     def init_with_custom_vad_threshold(self, audio_file, vad_threshold, voice_clone_prompt, assistant_prompt, enable_silence_filtering=False):
@@ -555,10 +1261,10 @@ class MiniCPMClient:
                 }]
             }
             
+            # 直接编码为bytes发送，避免requests内部json.dumps再对整段base64做一次str→bytes拷贝
             response = self.session.post(
                 f"{self.base_url}/init_options",
-                json=init_data,
-                headers={"uid": self.uid}
+                data=_json_encode(init_data)
             )
             
             print(f"✅ 使用VAD阈值 {vad_threshold:.2f} 初始化成功")
@@ -569,64 +1275,30 @@ class MiniCPMClient:
             raise
 
     def split_audio_into_chunks(self, audio_file, num_chunks=2):
-        """将音频文件分成指定数量的片段"""
+        """将音频文件分成指定数量的片段
+
+        片段一律编码为16位PCM WAV：16位源文件原样切分，8/24/32位整数及浮点源文件
+        由libsndfile转换为16位后再切分（服务端按16位PCM处理上传音频）。
+        """
         try:
-            with wave.open(audio_file, 'rb') as wav_file:
-                # 获取音频参数
-                frames = wav_file.getnframes()
-                sample_rate = wav_file.getframerate()
-                channels = wav_file.getnchannels()
-                sample_width = wav_file.getsampwidth()
-                
-                # 读取所有音频数据
-                audio_data = wav_file.readframes(frames)
-                
-                # 计算每个片段的大小
-                chunk_size = len(audio_data) // num_chunks
-                
-                chunks = []
-                for i in range(num_chunks):
-                    start = i * chunk_size
-                    if i == num_chunks - 1:  # 最后一个片段包含剩余所有数据
-                        end = len(audio_data)
-                    else:
-                        end = start + chunk_size
-                    
-                    chunk_data = audio_data[start:end]
-                    
-                    # 创建临时WAV文件
-                    
-                    with tempfile.NamedTemporaryFile(delete=False, suffix='.wav') as temp_file:
-                        with wave.open(temp_file.name, 'wb') as chunk_wav:
-                            chunk_wav.setnchannels(channels)
-                            chunk_wav.setsampwidth(sample_width)
-                            chunk_wav.setframerate(sample_rate)
-                            chunk_wav.writeframes(chunk_data)
-                        
-                        # 读取临时文件并转换为base64
-                        temp_file.seek(0)
-                        with open(temp_file.name, 'rb') as f:
-                            chunk_base64 = base64.b64encode(f.read()).decode('utf-8')
-                        
-                        chunks.append({
-                            'index': i + 1,
-                            'data': chunk_base64,
-                            'size': len(chunk_data),
-                            'duration': len(chunk_data) / (sample_rate * channels * sample_width)
-                        })
-                        
-                        # 删除临时文件
-                        os.unlink(temp_file.name)
-                
-                print(f"🔪 音频分片完成: {len(chunks)} 个片段")
-                return chunks
+            # 16位PCM WAV直接映射文件按帧切片；其他格式由libsndfile解码为int16后切片
+            chunks = _split_wav_mapped(audio_file, num_chunks)
+            if chunks is None:
+                audio_array, sample_rate = sf.read(audio_file, dtype='int16', always_2d=True)
+                frames, channels = audio_array.shape
+                with memoryview(audio_array).cast('B') as pcm:
+                    chunks = _encode_wav_chunks(pcm, frames, channels, sample_rate, 2, num_chunks)
+            
+            print(f"🔪 音频分片完成: {len(chunks)} 个片段")
+            return chunks
                 
         except Exception as e:
             print(f"❌ 音频分片失败: {e}")
             return []
 
 
-    def test_chunked_audio_processing(self, audio_file, skip_chunked_audio=False):
+    def test_chunked_audio_processing(self, audio_file, skip_chunked_audio=False, upload_workers=UPLOAD_CONCURRENCY):
+        """分片上传音频；upload_workers>1时并发上传（服务端不保证片段顺序，默认串行）"""
         # 分片处理
         if not skip_chunked_audio:
             chunks = self.split_audio_into_chunks(audio_file, num_chunks=2)
@@ -636,37 +1308,34 @@ class MiniCPMClient:
         else:
             chunks = [{"index": 1, "data": self.load_audio_file(audio_file), "size": len(audio_file), "duration": len(audio_file) / (16000 * 1 * 2)}]
         
-        start_time = time.time()
+        start_time = time.perf_counter()
         successful_chunks = 0
         failed_chunks = 0
         
-        for i, chunk in enumerate(chunks):
-            try:
-                # 判断是否为最后一个片段
-                is_last_chunk = (i == len(chunks) - 1)
-                
-                # 发送音频片段
-                stream_result = self.send_audio_with_completion_flag(
-                    chunk['data'], 
-                    end_of_stream=is_last_chunk
-                )
-                choices = stream_result.get('choices', {})
-                
-                if choices.get('content'):
-                    text_content = choices['content']
-                    if text_content == 'success':
-                        successful_chunks += 1
-                    else:
-                        failed_chunks += 1
-                
-            except Exception as e:
-                print(f"   💥 片段 {chunk['index']} 处理异常: {e}")
-                failed_chunks += 1
-            
-            # 片段间短暂延迟
-            time.sleep(0.1)
+        # 复用session的连接池，按提交顺序提交所有片段，去掉片段间的固定延迟
+        last = len(chunks) - 1
+        with ThreadPoolExecutor(max_workers=upload_workers) as pool:
+            futures = [
+                pool.submit(self.send_audio_with_completion_flag, chunk['data'], i == last)
+                for i, chunk in enumerate(chunks)
+            ]
+            for chunk, future in zip(chunks, futures):
+                try:
+                    stream_result = future.result()
+                    choices = stream_result.get('choices', {})
+                    
+                    if choices.get('content'):
+                        text_content = choices['content']
+                        if text_content == 'success':
+                            successful_chunks += 1
+                        else:
+                            failed_chunks += 1
+                    
+                except Exception as e:
+                    print(f"   💥 片段 {chunk['index']} 处理异常: {e}")
+                    failed_chunks += 1
         
-        end_time = time.time()
+        end_time = time.perf_counter()
         total_time = end_time - start_time
         
         success_rate = (successful_chunks / len(chunks)) * 100 if chunks else 0
@@ -674,8 +1343,44 @@ class MiniCPMClient:
         
         return None, None
 
+    def _start_callback_workers(self, on_audio_done, on_text_done, coalesce_audio=True):
+        """启动音频/文本回调线程，让回调的耗时不阻塞SSE读取；
+        coalesce_audio为True时积压的PCM帧合并后一次回调（base64数据不能合并，须传False）"""
+        self._stop_callback_workers()
+        # 每一代回调线程使用自己的队列，旧线程的退出信号不会被新线程取走，反之亦然
+        self._audio_q = queue.Queue(maxsize=_CALLBACK_QUEUE_SIZE)
+        self._text_q = queue.Queue(maxsize=_CALLBACK_QUEUE_SIZE)
+        self._callback_threads = []
+        audio_target = _audio_callback_worker if coalesce_audio else _callback_worker
+        for target, q, callback in ((audio_target, self._audio_q, on_audio_done),
+                                    (_callback_worker, self._text_q, on_text_done)):
+            worker = threading.Thread(target=target, args=(q, callback))
+            worker.daemon = True
+            worker.start()
+            self._callback_threads.append(worker)
+
+    def _stop_callback_workers(self):
+        """通知回调线程退出（队列中放入None）"""
+        if not self._callback_threads:
+            return
+        for q in (self._audio_q, self._text_q):
+            _put_drop_oldest(q, None)
+        # 退出信号只在旧线程自己的队列里，无需担心被新线程误取；
+        # 短暂等待只是尽量让旧回调先执行完，避免与新一代回调交错
+        for worker in self._callback_threads:
+            if worker is not threading.current_thread():
+                worker.join(timeout=1)
+        self._callback_threads = []
+
     def start_completions_listener_with_sse(self, on_audio_done, on_text_done):
-        """启动SSE流completions接口监听"""
+        """启动SSE流completions接口监听（已废弃，请使用 start_completions_listener）"""
+        warnings.warn(
+            "start_completions_listener_with_sse 已废弃，请使用 start_completions_listener",
+            DeprecationWarning,
+            stacklevel=2
+        )
+        self._start_callback_workers(on_audio_done, on_text_done)
+
         def listen():
             try:
                 # response = requests.post(
@@ -686,49 +1391,292 @@ class MiniCPMClient:
                 # )
                 response = self.send_completions_request()
                 print("✅ SSE Completions连接建立")
+                self._reset_response_pcm()
 
-                # 添加调试信息
-                print(f"📊 响应状态码: {response.status_code}")
-                print(f"📊 响应头: {dict(response.headers)}")
+                if _DEBUG:
+                    log.debug("响应状态码: %s", response.status_code)
+                    log.debug("响应头: %s", dict(response.headers))
 
-                client = SSEClient(response)
-                for event in client.events():
-                    if event.event == "message":
-                        try:
-                            data = json.loads(event.data)
-                            
-                            # 检查错误情况
-                            if 'error' in data:
-                                print(f"❌ 服务端错误: {data['error']}")
-                                continue
+                # 返回音频格式以第一个带 format 字段的帧为准，此前未声明时按WAV处理
+                stream_format = None
+
+                # 按SSE规则在bytes上分帧：累积data行，遇空行派发；只有message事件才解析JSON
+                event_type = None
+                data_lines = []
+                for line in _iter_sse_lines(response):
+                    line = line.rstrip(b'\r')
+                    if line.startswith(_DAT):
+                        data_lines.append(_sse_value(line, _LEN_DAT))
+                        continue
+                    if line.startswith(_EVT):
+                        event_type = _sse_value(line, _LEN_EVT).strip()
+                        continue
+                    if line:
+                        continue
+                    if not data_lines or event_type not in (None, b'message'):
+                        event_type = None
+                        data_lines.clear()
+                        continue
+                    payload = data_lines[0] if len(data_lines) == 1 else b'\n'.join(data_lines)
+                    event_type = None
+                    data_lines.clear()
+
+                    try:
+                        data = _json_loads(payload)
+                        
+                        # 检查错误情况
+                        if 'error' in data:
+                            print(f"❌ 服务端错误: {data['error']}")
+                            continue
+                        
+                        audio_base64, text, finish_reason = _extract_choice(data)
+
+                        # 只有帧中确实带 format 字段时才锁定格式，之前的帧按WAV处理
+                        if stream_format is None and 'format' in data:
+                            stream_format = data['format']
+
+                        # 检查多种结束条件
+                        if finish_reason in _FINISH_REASONS or (text and text.endswith('<end>')):
+                            print("🏁 检测到结束标志，停止接收")
+
+                        if audio_base64:
+                            pcm = base64_to_pcm(audio_base64, audio_format=stream_format or 'wav')
+                            if pcm is not None and pcm.size:
+                                if _DEBUG:
+                                    log.debug("收到音频片段: %d 字符", len(audio_base64))
+                                self._append_response_pcm(pcm)
+                                if not _put_frame(self._audio_q, pcm):
+                                    self._dropped_audio_frames += 1
+                                    log.warning("音频回调积压超时，已累计丢弃 %d 帧", self._dropped_audio_frames)
+
+                        if text and text != '\n<end>':
+                            if _DEBUG:
+                                log.debug("收到文本: %s", text)
+                            if not _put_frame(self._text_q, text):
+                                log.warning("文本回调积压超时，丢弃文本: %s", text)
                             
-                            choice = data.get('choices', [{}])[0]
-                            audio_base64 = choice.get('audio', '')
-                            text = choice.get('text', '')
-                            finish_reason = choice.get('finish_reason', '')
-
-                            # 检查多种结束条件
-                            if (text == '\n<end>' or 
-                                finish_reason in ['stop', 'completed'] or 
-                                text.endswith('<end>')):
-                                print("🏁 检测到结束标志，停止接收")
-
-                            if audio_base64:
-                                pcm_data = base64_to_pcm(audio_base64)
-                                if (hasattr(pcm_data[0], 'shape') and 
-                                    pcm_data[0].size > 0):
-                                    print(f"📦 收到音频片段: {len(audio_base64)} 字符")
-                                    on_audio_done(pcm_data[0])
-
-                            if text and text != '\n<end>':
-                                print(f"💬 收到文本: {text}")
-                                on_text_done(text)
-                                
-                        except json.JSONDecodeError as e:
-                            print(f"JSON解析错误: {e}")        
+                    except _JSON_ERRORS as e:
+                        print(f"JSON解析错误: {e}")
             except Exception as e:
                 print(f"Completions监听错误: {e}")
         
         self.completions_thread = threading.Thread(target=listen)
         self.completions_thread.daemon = True
         self.completions_thread.start()
+
+
+# aiohttp只有异步客户端需要，未安装时（如只装了WebRTC依赖）同步客户端仍可导入使用
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+# 异步客户端自建事件循环时优先用uvloop（libuv，epoll批量就绪通知、更少的每次读写开销）
+try:
+    import uvloop
+    _new_event_loop = uvloop.new_event_loop
+except ImportError:
+    _new_event_loop = asyncio.new_event_loop
+
+
+class AsyncMiniCPMClient:
+    """基于asyncio + aiohttp的MiniCPM客户端
+
+    音频上传与completions监听运行在同一个事件循环中，
+    SSE消息经 asyncio.Queue 交给调用方消费，避免监听线程与发送线程争抢GIL。
+    """
+
+    def __init__(self, base_url="http://localhost:32550", volume_gain=2.0):
+        if aiohttp is None:
+            raise ImportError("AsyncMiniCPMClient 需要 aiohttp，请先 pip install aiohttp")
+        self.base_url = base_url
+        self.uid = str(uuid.uuid4())
+        self.session_id = None
+        self.volume_gain = volume_gain
+
+        self.session = None
+        self.listen_task = None
+        self.auto_restart_listener = True
+        self._stop_event = None
+        self.message_queue = None
+
+        # 同步包装使用的事件循环
+        self._loop = None
+
+    def set_session_id(self, session_id):
+        self.session_id = session_id
+
+    async def _ensure_session(self):
+        if self.session is None or self.session.closed:
+            # 长连接池：上传与监听复用TCP连接
+            self.session = aiohttp.ClientSession(
+                headers={"uid": self.uid},
+                connector=aiohttp.TCPConnector(limit=8, keepalive_timeout=60)
+            )
+        if self.message_queue is None:
+            self.message_queue = asyncio.Queue(maxsize=1000)
+        return self.session
+
+    async def close(self):
+        """停止监听并关闭HTTP会话"""
+        await self.stop_completions_listener()
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+
+    async def check_service_status(self):
+        """检查服务状态"""
+        session = await self._ensure_session()
+        async with session.get(f"{self.base_url}/health") as response:
+            return response.status, await response.json(content_type=None)
+
+    async def send_audio_with_completion_flag(self, audio_data, end_of_stream=True):
+        """发送音频并明确标记是否为流的结束"""
+        session = await self._ensure_session()
+        # 与同步客户端共用预编码的请求体模板，不经过aiohttp内部的json.dumps
+        if isinstance(audio_data, str):
+            audio_data = audio_data.encode('ascii')
+        timestamp = b'%d' % (time.time_ns() // 1_000_000)
+        body = _STREAM_BODY_TEMPLATE % (audio_data, timestamp, b'')
+
+        async with session.post(
+            f"{self.base_url}/api/v1/stream",
+            data=body,
+            headers=_JSON_HEADERS,
+            timeout=aiohttp.ClientTimeout(total=30)
+        ) as response:
+            return await response.json(content_type=None, loads=_json_loads)
+
+    async def send_audio_chunks(self, chunks, concurrency=UPLOAD_CONCURRENCY):
+        """在同一会话的连接池上提交全部音频片段，返回与片段顺序一致的结果列表
+
+        concurrency 限制同时在途的请求数（默认 UPLOAD_CONCURRENCY），顺序无关时可调大
+        （如4）以重叠网络往返。失败的片段对应位置为异常对象。
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+        last = len(chunks) - 1
+
+        async def send(i, chunk):
+            async with semaphore:
+                return await self.send_audio_with_completion_flag(chunk['data'], end_of_stream=(i == last))
+
+        return await asyncio.gather(
+            *(send(i, chunk) for i, chunk in enumerate(chunks)),
+            return_exceptions=True
+        )
+
+    async def start_completions_listener(self, auto_restart=True):
+        """启动completions监听任务，消息通过 self.message_queue 交给调用方
+
+        连接断开后在同一个任务内按退出原因延迟重连，队列中出现None表示监听彻底结束。
+        """
+        await self._ensure_session()
+        self.auto_restart_listener = auto_restart
+        self._stop_event = asyncio.Event()
+        self.listen_task = asyncio.get_running_loop().create_task(self._listen_forever())
+        return self.message_queue
+
+    async def responses(self):
+        """以异步迭代器的形式逐条产出completions消息（dict），监听彻底结束时迭代结束
+
+        未启动监听时先以默认参数启动，用法：async for data in client.responses(): ...
+        """
+        if self.listen_task is None:
+            await self.start_completions_listener()
+        queue = self.message_queue
+        while True:
+            data = await queue.get()
+            if data is None:
+                return
+            yield data
+
+    async def stop_completions_listener(self):
+        """停止completions监听任务"""
+        if self._stop_event is not None:
+            self._stop_event.set()
+        if self.listen_task and not self.listen_task.done():
+            self.listen_task.cancel()
+            try:
+                await self.listen_task
+            except asyncio.CancelledError:
+                pass
+        self.listen_task = None
+
+    async def _listen_forever(self):
+        """监听循环：每次连接结束后按原因等待重连，等待期间可被停止事件立即打断"""
+        try:
+            while not self._stop_event.is_set():
+                exit_reason = await self._listen()
+                if not self.auto_restart_listener or self._stop_event.is_set():
+                    break
+
+                delay = _EXIT_DELAYS[exit_reason]
+                print(f"🔄 {delay}秒后自动重启监听器...")
+                try:
+                    await asyncio.wait_for(self._stop_event.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            print("📻 监听任务结束")
+            # 消费方可能已停止读取：不阻塞等待，队列满时丢弃最旧的消息以放入结束标记
+            try:
+                self.message_queue.put_nowait(None)
+            except asyncio.QueueFull:
+                self.message_queue.get_nowait()
+                self.message_queue.put_nowait(None)
+
+    async def _listen(self):
+        """读取一次completions SSE流，把data负载放入队列，返回退出原因"""
+        try:
+            async with self.session.post(
+                f"{self.base_url}/api/v1/completions",
+                headers=_SSE_HEADERS,
+                json={},
+                timeout=aiohttp.ClientTimeout(sock_connect=10, sock_read=900)
+            ) as resp:
+                print("✅ Completions连接建立")
+                async for line in _aiter_sse_lines(resp.content):
+                    if self._stop_event.is_set():
+                        print("🛑 收到停止信号，退出监听")
+                        return ExitReason.MANUAL_STOP
+
+                    line = line.strip()
+                    if not line.startswith(_DAT):
+                        continue
+
+                    current_data = _sse_value(line, _LEN_DAT)
+                    if b'<end>' in current_data:
+                        print("🏁 检测到结束标志，停止接收")
+                        return ExitReason.END_SIGNAL
+
+                    try:
+                        data = _json_loads(current_data)
+                    except _JSON_ERRORS as e:
+                        print(f"JSON解析错误: {e}")
+                        continue
+                    await self.message_queue.put(data)
+
+            return ExitReason.STREAM_ENDED
+
+        except (asyncio.TimeoutError, aiohttp.ServerTimeoutError) as e:
+            # ServerTimeoutError同时继承ClientConnectionError，需先于连接错误捕获，sock_read超时才归为TIMEOUT
+            print(f"⏰ 连接超时: {e}")
+            return ExitReason.TIMEOUT
+        except aiohttp.ServerDisconnectedError as e:
+            print(f"🔌 服务器断开连接: {e}")
+            return ExitReason.SERVER_DISCONNECT
+        except aiohttp.ClientConnectionError as e:
+            print(f"🔌 连接错误: {e}")
+            return ExitReason.CONNECTION_ERROR
+        except aiohttp.ClientError as e:
+            print(f"🌐 网络请求错误: {e}")
+            return ExitReason.REQUEST_ERROR
+        except Exception as e:
+            # 其余异常同样按退出原因延迟重连，避免监听任务直接结束
+            print(f"❌ 监听异常: {e}")
+            return ExitReason.EXCEPTION
+
+    def run_until_complete(self, coro):
+        """同步包装：在客户端自有的事件循环中执行协程，兼容同步调用方"""
+        if self._loop is None or self._loop.is_closed():
+            self._loop = _new_event_loop()
+        return self._loop.run_until_complete(coro)
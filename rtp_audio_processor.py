@@ -2,9 +2,7 @@ import asyncio
 import socket
 import struct
 import logging
-import time
-from collections import deque
-from typing import Deque
+from typing import List, Union
 
 import numpy as np
 import websockets
@@ -26,38 +24,106 @@ BYTES_PER_FRAME = SAMPLES_PER_FRAME * BYTES_PER_SAMPLE
 
 PAYLOAD_TYPE = 96               # RTP PayloadType (96 ~ 127 动态类型)
 SSRC = 0x12345678               # 固定 SSRC
+RECV_BATCH = 32                 # 每次唤醒最多连续读取的 RTP 包数
+# UDP 收发缓冲区请求字节数，用于吸收调度停顿期间的突发。内核按每个数据报的 skb truesize
+# （远大于 RTP 负载）计费，且请求值会被 net.core.rmem_max/wmem_max 截断，实际能缓存的时长
+# 取决于系统配置；以启动时日志打印的实际生效值为准
+SOCKET_BUFFER_SIZE = 1 << 20
+IP_TOS_EF = 0xB8                # DSCP EF（加速转发），用于发送的低延迟音频
 
 SILENCE_THRESHOLD = 500         # 判定静默的平均幅度阈值
 SILENCE_DURATION = 3.0          # 连续静默秒数
-# ================================================== #
-
-
-def parse_rtp_payload(packet: bytes) -> bytes:
-    """提取 RTP 负载（假设无扩展、CSRC 等）。"""
-    if len(packet) < 12:
-        return b''
-    return packet[12:]
 
+RECONNECT_BASE_DELAY = 0.5      # WebSocket 重连初始等待秒数（指数退避）
+RECONNECT_MAX_DELAY = 8.0       # 重连等待上限秒数
+RECONNECT_MAX_ATTEMPTS = 5      # 单次请求最多连接尝试次数
+MAX_UTTERANCE_SEC = 30          # 单段语音缓冲上限秒数，超出时丢弃最早的音频
+QUEUE_MAXSIZE = 200             # 收发帧队列上限（约 4 秒音频）
+MAX_BATCH_FRAMES = 50           # 静默检测每次最多批量取出的帧数（约 1 秒）
+# ================================================== #
 
-def build_rtp_packet(payload: bytes, seq: int, timestamp: int, payload_type: int = PAYLOAD_TYPE, marker: int = 0) -> bytes:
-    """构造最简 RTP 包（无扩展、无 CSRC）。"""
+# 整帧绝对幅度之和的阈值：与“平均幅度 < SILENCE_THRESHOLD”等价，全程整数比较
+_SILENCE_SUM_THRESHOLD = SILENCE_THRESHOLD * SAMPLES_PER_FRAME
+_MAX_UTTERANCE_BYTES = MAX_UTTERANCE_SEC * SAMPLE_RATE * BYTES_PER_SAMPLE
+
+# 预编译的 RTP 固定头格式，避免每包重新解析格式串
+_RTP_HDR = struct.Struct('!BBHII')
+_RTP_EXT = struct.Struct('!HH')
+# 短帧补零用的零字节视图，切片不产生拷贝
+_ZERO_FRAME = memoryview(bytes(BYTES_PER_FRAME))
+
+
+def parse_rtp_payload(packet: Union[bytes, memoryview]) -> memoryview:
+    """提取 RTP 负载（跳过 CSRC 与扩展头、去掉填充），返回指向原包的视图，不拷贝；非法包返回空视图。"""
+    mv = memoryview(packet)
+    end = len(mv)
+    if end < _RTP_HDR.size or mv[0] >> 6 != 2:
+        return mv[:0]
+    b1 = mv[0]
+    hdr_len = _RTP_HDR.size + 4 * (b1 & 0x0F)
+    if b1 & 0x10:
+        # 扩展头：2 字节 profile + 2 字节长度（单位为 32 位字）
+        if end < hdr_len + 4:
+            return mv[:0]
+        _profile, ext_words = _RTP_EXT.unpack_from(mv, hdr_len)
+        hdr_len += 4 + 4 * ext_words
+    if b1 & 0x20:
+        # 填充：最后一个字节是填充长度（含自身）
+        end -= mv[end - 1]
+    if hdr_len > end:
+        return mv[:0]
+    return mv[hdr_len:end]
+
+
+def _rtp_flag_bytes(payload_type: int = PAYLOAD_TYPE, marker: int = 0):
+    """计算 RTP 头前两个字节（版本/标志位、marker/负载类型）。"""
     v = 2  # RTP version
     p = 0  # no padding
     x = 0  # no extension
     cc = 0  # CSRC count
     b1 = (v << 6) | (p << 5) | (x << 4) | cc
     b2 = (marker << 7) | (payload_type & 0x7F)
-    header = struct.pack('!BBHII', b1, b2, seq & 0xFFFF, timestamp & 0xFFFFFFFF, SSRC)
+    return b1, b2
+
+
+def build_rtp_packet(payload: bytes, seq: int, timestamp: int, payload_type: int = PAYLOAD_TYPE, marker: int = 0) -> bytes:
+    """构造最简 RTP 包（无扩展、无 CSRC）。"""
+    b1, b2 = _rtp_flag_bytes(payload_type, marker)
+    header = _RTP_HDR.pack(b1, b2, seq & 0xFFFF, timestamp & 0xFFFFFFFF, SSRC)
     return header + payload
 
 
-def frame_is_silent(frame: bytes) -> bool:
+def frame_is_silent(frame: Union[bytes, memoryview]) -> bool:
     """判断单帧是否为静默（平均绝对幅度低于阈值）。"""
     if len(frame) < BYTES_PER_FRAME:
         # 不完整帧按静默处理
         return True
     pcm = np.frombuffer(frame, dtype=np.int16)
-    return np.abs(pcm).mean() < SILENCE_THRESHOLD
+    # 在 int32 上取绝对值，避免 -32768 溢出
+    return np.abs(pcm, dtype=np.int32).sum() < SILENCE_THRESHOLD * len(pcm)
+
+
+def frame_is_silent_batch(frames_np: np.ndarray) -> np.ndarray:
+    """批量判断静默：输入 (N, SAMPLES_PER_FRAME) 的 int16 数组，返回长度 N 的布尔数组。"""
+    return np.abs(frames_np, dtype=np.int32).sum(axis=1) < _SILENCE_SUM_THRESHOLD
+
+
+def _frames_silent(frames: List[memoryview]) -> List[bool]:
+    """对一批帧做静默判断；全部为整帧时拼成一个二维视图一次计算。"""
+    if all(len(f) == BYTES_PER_FRAME for f in frames):
+        view = np.frombuffer(b''.join(frames), dtype=np.int16).reshape(-1, SAMPLES_PER_FRAME)
+        return frame_is_silent_batch(view).tolist()
+    return [frame_is_silent(f) for f in frames]
+
+
+def _put_drop_oldest(q: asyncio.Queue, item):
+    """非阻塞入队；队列满时丢弃最旧的一帧，实时音频宁可丢旧帧也不积压。"""
+    try:
+        q.put_nowait(item)
+    except asyncio.QueueFull:
+        q.get_nowait()
+        logging.debug('接收队列已满，丢弃最旧的一帧')
+        q.put_nowait(item)
 
 
 async def rtp_receiver(sock: socket.socket, frame_queue: asyncio.Queue):
@@ -65,9 +131,18 @@ async def rtp_receiver(sock: socket.socket, frame_queue: asyncio.Queue):
     loop = asyncio.get_running_loop()
     while True:
         data, _addr = await loop.sock_recvfrom(sock, 4096)
-        payload = parse_rtp_payload(data)
-        if payload:
-            await frame_queue.put(payload)
+        # 被唤醒后直接非阻塞地连续读取已到达的包，减少每包一次的事件循环往返
+        packets = [data]
+        while len(packets) < RECV_BATCH:
+            try:
+                data, _addr = sock.recvfrom(4096)
+            except BlockingIOError:
+                break
+            packets.append(data)
+        for data in packets:
+            payload = parse_rtp_payload(data)
+            if payload:
+                _put_drop_oldest(frame_queue, payload)
 
 
 async def rtp_sender(sock: socket.socket, frame_queue: asyncio.Queue, dst):
@@ -75,64 +150,125 @@ async def rtp_sender(sock: socket.socket, frame_queue: asyncio.Queue, dst):
     loop = asyncio.get_running_loop()
     seq = 0
     timestamp = 0
+    b1, b2 = _rtp_flag_bytes()
+    hdr_size = _RTP_HDR.size
+    # 整个包复用同一块缓冲区：头部原地写入，负载直接拷到头部之后，不再拼接 bytes
+    packet = bytearray(hdr_size + BYTES_PER_FRAME)
+    view = memoryview(packet)
     while True:
         frame = await frame_queue.get()
+        n = len(frame)
+        view[hdr_size:hdr_size + n] = frame
         # 若帧长度不足 BYTES_PER_FRAME，进行 0 填充
-        if len(frame) < BYTES_PER_FRAME:
-            frame += b'\x00' * (BYTES_PER_FRAME - len(frame))
-        packet = build_rtp_packet(frame, seq, timestamp)
-        await loop.sock_sendto(sock, packet, dst)
+        if n < BYTES_PER_FRAME:
+            view[hdr_size + n:] = _ZERO_FRAME[n:]
+        _RTP_HDR.pack_into(packet, 0, b1, b2, seq, timestamp, SSRC)
+        # 发送完成前不会取下一帧，复用缓冲区是安全的
+        await loop.sock_sendto(sock, view, dst)
         seq = (seq + 1) % 0x10000
         timestamp = (timestamp + SAMPLES_PER_FRAME) % 0xFFFFFFFF
 
 
-async def query_llm_via_ws(audio_bytes: bytes) -> bytes:
-    """通过 WebSocket 调用大模型，把音频发送过去并获取返回音频。"""
-    logging.info('连接大模型 WebSocket 服务...')
-    async with websockets.connect(WS_URI, max_size=None) as ws:
-        await ws.send(audio_bytes)
-        logging.info('已发送 %d 字节音频，等待回复...', len(audio_bytes))
-        resp = await ws.recv()
+class LLMSession:
+    """复用同一条 WebSocket 连接调用大模型，避免每段语音都重新握手；断开后按指数退避重连。"""
+
+    def __init__(self, uri: str = WS_URI):
+        self._uri = uri
+        self._ws = None
+        # 服务端按“一问一答”顺序回复，同一时刻只允许一个请求在途
+        self._lock = asyncio.Lock()
+
+    async def _connect(self):
+        """建立连接，失败时指数退避重试，超过次数后抛出最后一次异常。"""
+        delay = RECONNECT_BASE_DELAY
+        for attempt in range(1, RECONNECT_MAX_ATTEMPTS + 1):
+            try:
+                logging.info('连接大模型 WebSocket 服务...')
+                self._ws = await websockets.connect(self._uri, max_size=None)
+                return self._ws
+            except (OSError, websockets.WebSocketException) as e:
+                if attempt == RECONNECT_MAX_ATTEMPTS:
+                    raise
+                logging.warning('WebSocket 连接失败: %s，%.1f 秒后重试', e, delay)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, RECONNECT_MAX_DELAY)
+
+    async def request(self, audio_bytes: Union[bytes, memoryview]) -> bytes:
+        """把音频发送给大模型并等待返回音频；连接已断开时重连后重发一次。"""
+        async with self._lock:
+            for retry in (False, True):
+                ws = self._ws or await self._connect()
+                try:
+                    await ws.send(audio_bytes)
+                    logging.info('已发送 %d 字节音频，等待回复...', len(audio_bytes))
+                    resp = await ws.recv()
+                    break
+                except websockets.ConnectionClosed:
+                    self._ws = None
+                    if retry:
+                        raise
+                    logging.warning('WebSocket 连接已断开，重连后重发')
         if isinstance(resp, str):
             resp = resp.encode()
         logging.info('收到回复音频 %d 字节', len(resp))
         return resp
 
+    async def close(self):
+        """关闭连接。"""
+        if self._ws is not None:
+            await self._ws.close()
+            self._ws = None
+
 
-async def silence_detector_processor(in_queue: asyncio.Queue, out_queue: asyncio.Queue):
+async def silence_detector_processor(in_queue: asyncio.Queue, out_queue: asyncio.Queue, session: LLMSession):
     """检测静默，当静默超过阈值后把缓冲音频发送到大模型服务，返回结果写入发送队列。"""
-    buffer: Deque[bytes] = deque()
+    # 连续追加到同一个 bytearray，触发时无需再 join 拼接
+    buffer = bytearray()
     silent_time = 0.0
-    last_check = time.time()
 
     while True:
-        frame = await in_queue.get()
-        buffer.append(frame)
-
-        now = time.time()
-        elapsed = now - last_check
-        last_check = now
-
-        # 根据当前帧是否静默更新静默计时
-        if frame_is_silent(frame):
-            silent_time += FRAME_DURATION
-        else:
-            silent_time = 0.0
-
-        # 若静默时间超过阈值，触发发送
-        if silent_time >= SILENCE_DURATION and buffer:
-            audio_bytes = b''.join(buffer)
-            buffer.clear()
-            silent_time = 0.0
-
-            logging.info('检测到 %.1f 秒静默，向大模型发送 %d 字节音频', SILENCE_DURATION, len(audio_bytes))
-            try:
-                resp_audio = await query_llm_via_ws(audio_bytes)
-                # 把返回音频切成帧加入 out_queue
-                for i in range(0, len(resp_audio), BYTES_PER_FRAME):
-                    await out_queue.put(resp_audio[i:i + BYTES_PER_FRAME])
-            except Exception as e:
-                logging.error('WebSocket 调用失败: %s', e)
+        # 等到一帧后顺带取走已积压的帧，一批只做一次静默计算
+        frames = [await in_queue.get()]
+        while len(frames) < MAX_BATCH_FRAMES and not in_queue.empty():
+            frames.append(in_queue.get_nowait())
+
+        for frame, silent in zip(frames, _frames_silent(frames)):
+            buffer += frame
+            if len(buffer) > _MAX_UTTERANCE_BYTES:
+                # 长时间无静默（如持续噪声）时只保留最近的 MAX_UTTERANCE_SEC 秒
+                del buffer[:len(buffer) - _MAX_UTTERANCE_BYTES]
+
+            # 根据当前帧是否静默更新静默计时
+            if silent:
+                silent_time += FRAME_DURATION
+            else:
+                silent_time = 0.0
+
+            # 若静默时间超过阈值，触发发送
+            if silent_time >= SILENCE_DURATION and buffer:
+                silent_time = 0.0
+
+                logging.info('检测到 %.1f 秒静默，向大模型发送 %d 字节音频', SILENCE_DURATION, len(buffer))
+                try:
+                    # 直接发送缓冲区视图（零拷贝）；视图释放后才能清空缓冲区
+                    with memoryview(buffer) as audio_view:
+                        resp_audio = await session.request(audio_view)
+                    # 把返回音频切成帧加入 out_queue
+                    for i in range(0, len(resp_audio), BYTES_PER_FRAME):
+                        await out_queue.put(resp_audio[i:i + BYTES_PER_FRAME])
+                except Exception as e:
+                    logging.error('WebSocket 调用失败: %s', e)
+                finally:
+                    del buffer[:]
+
+
+def _set_socket_buffer(sock: socket.socket, option: int, size: int = SOCKET_BUFFER_SIZE) -> int:
+    """设置套接字缓冲区大小，返回内核实际生效的值（受 net.core.rmem_max/wmem_max 限制）。"""
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, option, size)
+    except OSError as e:
+        logging.warning('设置套接字缓冲区失败: %s', e)
+    return sock.getsockopt(socket.SOL_SOCKET, option)
 
 
 async def main():
@@ -140,21 +276,34 @@ async def main():
     recv_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     recv_sock.bind(('0.0.0.0', INPUT_PORT))
     recv_sock.setblocking(False)
+    rcvbuf = _set_socket_buffer(recv_sock, socket.SO_RCVBUF)
 
     send_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     send_sock.setblocking(False)
-
-    frame_in_queue: asyncio.Queue = asyncio.Queue()
-    frame_out_queue: asyncio.Queue = asyncio.Queue()
+    sndbuf = _set_socket_buffer(send_sock, socket.SO_SNDBUF)
+    if hasattr(socket, 'IP_TOS'):
+        try:
+            send_sock.setsockopt(socket.IPPROTO_IP, socket.IP_TOS, IP_TOS_EF)
+        except OSError as e:
+            logging.warning('设置 IP_TOS 失败: %s', e)
+    logging.info('UDP 接收缓冲区 %d 字节，发送缓冲区 %d 字节', rcvbuf, sndbuf)
+
+    # 有界队列：下游卡住时接收端丢弃旧帧，处理端在 put 上等待，避免内存无限增长
+    frame_in_queue: asyncio.Queue = asyncio.Queue(maxsize=QUEUE_MAXSIZE)
+    frame_out_queue: asyncio.Queue = asyncio.Queue(maxsize=QUEUE_MAXSIZE)
+    session = LLMSession()
 
     tasks = [
         asyncio.create_task(rtp_receiver(recv_sock, frame_in_queue)),
-        asyncio.create_task(silence_detector_processor(frame_in_queue, frame_out_queue)),
+        asyncio.create_task(silence_detector_processor(frame_in_queue, frame_out_queue, session)),
         asyncio.create_task(rtp_sender(send_sock, frame_out_queue, (OUTPUT_IP, OUTPUT_PORT)))
     ]
 
     logging.info('RTP 接收端口 %d，发送到 %s:%d，WebSocket: %s', INPUT_PORT, OUTPUT_IP, OUTPUT_PORT, WS_URI)
-    await asyncio.gather(*tasks)
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        await session.close()
 
 
 if __name__ == '__main__':
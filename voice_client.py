@@ -6,7 +6,19 @@ Python Voice Client for MiniCPM-o-2.6
 
 import asyncio
 import json
-import base64
+# SSE消息JSON解析优先用orjson；其JSONDecodeError是json.JSONDecodeError的子类，异常处理不变
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+try:
+    import pybase64 as base64  # SIMD加速，接口与标准库base64一致
+    _b64decode = base64.b64decode
+except ImportError:
+    import base64
+    # 标准库下直接用C实现的a2b_base64，省去b64decode的参数转换包装层
+    from binascii import a2b_base64 as _b64decode
 import wave
 import io
 import time
@@ -21,7 +33,6 @@ import pyaudio
 import websockets
 import httpx
 import numpy as np
-from sseclient import SSEClient
 
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -139,16 +150,16 @@ class VoiceClient:
             wav_file.setnchannels(self.channels)
             wav_file.setsampwidth(2)  # 16位 = 2字节
             wav_file.setframerate(self.sample_rate)
-            wav_file.writeframes(audio_data.tobytes())
+            wav_file.writeframes(audio_data)  # 直接写入数组缓冲区，省去tobytes拷贝
         
-        buffer.seek(0)
-        wav_data = buffer.read()
-        return base64.b64encode(wav_data).decode('utf-8')
+        # getbuffer()返回零拷贝视图，不再seek+read出一份完整bytes
+        with buffer.getbuffer() as wav_data:
+            return base64.b64encode(wav_data).decode('ascii')
 
     def decode_audio_from_base64(self, base64_data: str) -> np.ndarray:
         """从base64字符串解码音频数据"""
         try:
-            audio_bytes = base64.b64decode(base64_data)
+            audio_bytes = _b64decode(base64_data)
             buffer = io.BytesIO(audio_bytes)
             
             with wave.open(buffer, 'rb') as wav_file:
@@ -243,7 +254,7 @@ class VoiceClient:
                         try:
                             data_str = line[6:]  # 移除"data: "前缀
                             if data_str.strip():
-                                data = json.loads(data_str)
+                                data = _json_loads(data_str)
                                 await self.handle_sse_message(data)
                         except json.JSONDecodeError:
                             continue
@@ -560,7 +571,7 @@ class VoiceClient:
                         try:
                             data_str = line[6:]  # 移除"data: "前缀
                             if data_str.strip():
-                                data = json.loads(data_str)
+                                data = _json_loads(data_str)
                                 await self.handle_sse_message_proxy(data)
                         except json.JSONDecodeError:
                             continue